@@ -0,0 +1,83 @@
+"""
+Per-order cost of building export e-invoices.
+
+Times ``build_invoice`` alone and followed by ``invoice_to_json`` over
+synthetic 8-line orders, taking the best of several runs. To compare with
+an older revision, run this script against a checkout of it: revisions
+without ``build_invoice`` are timed through ``generate_gst_invoice_data``,
+and the JSON step is skipped where ``invoice_to_json`` is missing.
+
+Usage: PYTHONPATH=src python benchmarks/bench_invoice_build.py [ORDERS] [REPEAT]
+"""
+
+import sys
+import timeit
+
+from gst_shopify import e_invoice_exp_lut as e_invoice
+
+SELLER = {
+    "Gstin": "33AAAAA0000A1Z5",
+    "LglNm": "Seller",
+    "Addr1": "1 Main St",
+    "Loc": "Auroville",
+    "Pin": 605101,
+    "Stcd": "34",
+}
+LINES = 8
+
+
+def make_order(number):
+    edges = [
+        {
+            "node": {
+                "title": f"Item {i}",
+                "name": f"Item {i}",
+                "quantity": i + 1,
+                "fulfillmentStatus": "UNFULFILLED" if i == 3 else "FULFILLED",
+                "originalUnitPriceSet": {"shopMoney": {"amount": "12.35"}},
+                "totalDiscountSet": {"shopMoney": {"amount": "1.10"}},
+                "variant": {"inventoryItem": {"harmonizedSystemCode": "61091000"}},
+            }
+        }
+        for i in range(LINES)
+    ]
+    return {
+        "id": f"gid://shopify/Order/{number}",
+        "name": f"#{number}",
+        "createdAt": "2024-04-01T10:00:00Z",
+        "fulfillments": [{"createdAt": "2024-04-03T10:00:00Z"}],
+        "customer": {"firstName": "Asha", "lastName": "Rao"},
+        "shippingAddress": {"address1": "1 Main St", "city": "Auroville"},
+        "totalShippingPriceSet": {"shopMoney": {"amount": "5.00"}},
+        "totalDiscountsSet": {"shopMoney": {"amount": "0.00"}},
+        "lineItems": {"edges": edges},
+    }
+
+
+def _log(message):
+    pass
+
+
+def main(count=500, repeat=5):
+    orders = [make_order(number) for number in range(count)]
+    build = getattr(e_invoice, "build_invoice", e_invoice.generate_gst_invoice_data)
+
+    def build_only():
+        for order in orders:
+            build(order, SELLER, _log)
+
+    def build_and_json():
+        for order in orders:
+            e_invoice.invoice_to_json(build(order, SELLER, _log))
+
+    timings = [("build", build_only)]
+    if hasattr(e_invoice, "invoice_to_json"):
+        timings.append(("build+json", build_and_json))
+    print(f"{count} orders of {LINES} lines, best of {repeat}")
+    for name, func in timings:
+        best = min(timeit.repeat(func, number=1, repeat=repeat))
+        print(f"{name}: {best / count * 1e6:.0f} µs/order")
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:3]))
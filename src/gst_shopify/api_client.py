@@ -1,54 +1,190 @@
-import os
+import asyncio
+import contextlib
+import threading
 import time
 
-import requests
+from gst_shopify.config import (
+    get_max_concurrency,
+    get_pool_size,
+    get_shopify_credentials,
+)
+from gst_shopify.throttle import CostThrottler
 
-from gst_shopify.config import get_shopify_credentials
+API_VERSION = "2024-10"
 
-SHOPIFY_STORE, API_TOKEN = get_shopify_credentials()
+_credentials = None
+_session = None
+_session_lock = threading.Lock()
+
+# Shared by every caller so that concurrent requests draw on one cost budget.
+throttler = CostThrottler()
+
+
+def get_credentials():
+    """
+    Return (store, token), read from the environment on first use so that
+    importing this module (e.g. for ``--help``) needs no credentials.
+    """
+    global _credentials
+    if _credentials is None:
+        _credentials = get_shopify_credentials()
+    return _credentials
+
+
+def get_session():
+    """
+    Return the shared keep-alive session used for all Shopify requests.
+
+    Connections are pooled per host, so repeated GraphQL calls reuse
+    the same TLS connection instead of handshaking on every request.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            # Imported here to keep CLI startup fast; see get_credentials.
+            import requests
+            from requests.adapters import HTTPAdapter
+
+            pool_size = get_pool_size()
+            session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=pool_size, pool_maxsize=pool_size, pool_block=True
+            )
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            session.headers.update(
+                {
+                    "Content-Type": "application/json",
+                    "Accept-Encoding": "gzip",
+                    "X-Shopify-Access-Token": get_credentials()[1],
+                    "User-Agent": "python-requests",
+                }
+            )
+            _session = session
+        return _session
+
+
+def get_session_stats():
+    """
+    Report how many requests went through the shared session and how many
+    connections had to be opened for them.
+
+    Returns:
+        dict: requests, connections and reused (requests that skipped a handshake)
+    """
+    stats = {"requests": 0, "connections": 0, "reused": 0}
+    if _session is None:
+        return stats
+    pools = _session.get_adapter(f"https://{get_credentials()[0]}").poolmanager.pools
+    for key in pools.keys():
+        pool = pools.get(key)
+        if pool is None:
+            continue
+        stats["requests"] += pool.num_requests
+        stats["connections"] += pool.num_connections
+    stats["reused"] = max(stats["requests"] - stats["connections"], 0)
+    return stats
+
+
+def admin_url(path):
+    return f"https://{get_credentials()[0]}/admin/api/{API_VERSION}/{path}"
+
+
+def _is_throttled(response_data):
+    return any(
+        error.get("extensions", {}).get("code") == "THROTTLED"
+        for error in response_data.get("errors", [])
+    )
+
+
+def _post_graphql(query, reserved, retries):
+    """
+    Send a single GraphQL request and settle its cost with the throttler.
+
+    Returns:
+        tuple: (response_data, None) on success, or (None, delay) when the
+        request should be retried after ``delay`` seconds
+    """
+    import requests
+
+    try:
+        response = get_session().post(
+            admin_url("graphql.json"), json={"query": query}, timeout=10
+        )
+    except requests.exceptions.RequestException as err:
+        throttler.release(reserved)
+        print(f"Connection error: {err}. Retrying...")
+        return None, 2 ** (retries + 1)  # Exponential backoff
+
+    if response.status_code == 429:  # Too many requests
+        throttler.release(reserved)
+        throttler.record_throttle()
+        retry_after = response.headers.get(
+            "Retry-After", 5
+        )  # Default to 5 seconds if not provided
+        print(f"Rate limit hit. Retrying after {retry_after} seconds...")
+        return None, float(retry_after)
+
+    try:
+        response.raise_for_status()
+    except requests.exceptions.HTTPError as http_err:
+        throttler.release(reserved)
+        print(f"HTTP error occurred: {http_err}")
+        print(
+            f"Response content: {response.text}"
+        )  # Capture and log error details from response
+        raise Exception("Max retries reached. Connection failed.")
+
+    response_data = response.json()
+    throttler.settle(reserved, query, response_data.get("extensions", {}).get("cost"))
+
+    if _is_throttled(response_data):
+        throttler.record_throttle()
+        print("Query throttled. Waiting for the cost bucket to refill...")
+        return None, 0
+
+    if "errors" in response_data:
+        print(f"GraphQL errors: {response_data['errors']}")
+
+    return response_data, None
 
 
 def graphql_request(query, max_retries=5):
-    url = f"https://{SHOPIFY_STORE}/admin/api/2024-10/graphql.json"
-    headers = {
-        "Content-Type": "application/json",
-        "X-Shopify-Access-Token": API_TOKEN,
-        "User-Agent": "python-requests",
-    }
     retries = 0
     while retries < max_retries:
-        try:
-            response = requests.post(
-                url, json={"query": query}, headers=headers, timeout=10
-            )
+        reserved = throttler.estimate_cost(query)
+        time.sleep(throttler.reserve(reserved))
+        response_data, delay = _post_graphql(query, reserved, retries)
+        if response_data is not None:
+            return response_data
+        retries += 1
+        time.sleep(delay)
+    raise Exception("Max retries reached. Connection failed.")
 
-            #            api_call_limit = response.headers.get("X-Shopify-Shop-Api-Call-Limit")
-            #            print(f"API call limit: {api_call_limit}")
-            #            api_cost = response.headers.get("X-GraphQL-Cost-Incurred")
-            #            print(f"API request cost: {api_cost}")
 
-            response.raise_for_status()
-            response_data = response.json()
+def make_semaphore(concurrency=None):
+    """Create a semaphore bounding in-flight requests for the running event loop."""
+    return asyncio.Semaphore(concurrency or get_max_concurrency())
 
-            if "errors" in response_data:
-                print(f"GraphQL errors: {response_data['errors']}")
 
+async def async_graphql_request(query, max_retries=5, semaphore=None):
+    """
+    Async counterpart of graphql_request.
+
+    The HTTP call runs on the shared pooled session in a worker thread, and the
+    wait for cost budget is awaited, so many queries can be in flight while
+    still drawing on the same throttler as the synchronous path.
+    """
+    retries = 0
+    while retries < max_retries:
+        async with semaphore or contextlib.nullcontext():
+            reserved = throttler.estimate_cost(query)
+            await asyncio.sleep(throttler.reserve(reserved))
+            response_data, delay = await asyncio.to_thread(
+                _post_graphql, query, reserved, retries
+            )
+        if response_data is not None:
             return response_data
-        except requests.exceptions.HTTPError as http_err:
-            if response.status_code == 429:  # Too many requests
-                retry_after = response.headers.get(
-                    "Retry-After", 5
-                )  # Default to 5 seconds if not provided
-                print(f"Rate limit hit. Retrying after {retry_after} seconds...")
-                time.sleep(int(retry_after))
-            else:
-                print(f"HTTP error occurred: {http_err}")
-                print(
-                    f"Response content: {response.text}"
-                )  # Capture and log error details from response
-            break
-        except requests.exceptions.RequestException as err:
-            print(f"Connection error: {err}. Retrying...")
-            retries += 1
-            time.sleep(2**retries)  # Exponential backoff
+        retries += 1
+        await asyncio.sleep(delay)
     raise Exception("Max retries reached. Connection failed.")
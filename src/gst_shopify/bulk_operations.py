@@ -0,0 +1,203 @@
+import json
+import tempfile
+import time
+from itertools import islice
+
+from gst_shopify.api_client import get_session, graphql_request
+
+POLL_INTERVAL = 5  # seconds between bulk operation status checks
+FINISHED_STATUSES = {"COMPLETED", "FAILED", "CANCELED", "EXPIRED"}
+
+
+def run_bulk_query(query):
+    """
+    Submit a bulkOperationRunQuery for the given (unpaginated) query.
+
+    Returns:
+        str: The bulk operation ID
+    """
+    mutation = f'''
+    mutation {{
+        bulkOperationRunQuery(query: """{query}""") {{
+            bulkOperation {{
+                id
+                status
+            }}
+            userErrors {{
+                field
+                message
+            }}
+        }}
+    }}
+    '''
+    response = graphql_request(mutation)
+    result = response["data"]["bulkOperationRunQuery"]
+    if result["userErrors"]:
+        raise ValueError(f"Bulk operation rejected: {result['userErrors']}")
+    return result["bulkOperation"]["id"]
+
+
+def staged_upload_jsonl(lines, filename="bulk_variables.jsonl"):
+    """
+    Upload JSONL content for a bulk mutation through stagedUploadsCreate.
+
+    Args:
+        lines: Iterable of JSON-serialisable objects, one per line
+        filename: Name given to the uploaded file
+
+    Returns:
+        str: The staged upload path to pass to bulkOperationRunMutation
+    """
+    mutation = f"""
+    mutation {{
+        stagedUploadsCreate(input: [{{
+            resource: BULK_MUTATION_VARIABLES,
+            filename: "{filename}",
+            mimeType: "text/jsonl",
+            httpMethod: POST
+        }}]) {{
+            stagedTargets {{
+                url
+                parameters {{
+                    name
+                    value
+                }}
+            }}
+            userErrors {{
+                field
+                message
+            }}
+        }}
+    }}
+    """
+    response = graphql_request(mutation)
+    result = response["data"]["stagedUploadsCreate"]
+    if result["userErrors"]:
+        raise ValueError(f"Staged upload rejected: {result['userErrors']}")
+    target = result["stagedTargets"][0]
+    parameters = {param["name"]: param["value"] for param in target["parameters"]}
+
+    with tempfile.TemporaryFile() as f:
+        for line in lines:
+            f.write(json.dumps(line).encode() + b"\n")
+        f.seek(0)
+        # The target is a signed storage form, not the Admin API.
+        response = get_session().post(
+            target["url"],
+            data=parameters,
+            files={"file": (filename, f, "text/jsonl")},
+            headers={"X-Shopify-Access-Token": None, "Content-Type": None},
+            timeout=300,
+        )
+    response.raise_for_status()
+    return parameters["key"]
+
+
+def run_bulk_mutation(mutation, staged_upload_path):
+    """
+    Submit a bulkOperationRunMutation that runs ``mutation`` once per line of
+    a staged JSONL variables file.
+
+    Returns:
+        str: The bulk operation ID
+    """
+    wrapper = f'''
+    mutation {{
+        bulkOperationRunMutation(
+            mutation: """{mutation}""",
+            stagedUploadPath: "{staged_upload_path}"
+        ) {{
+            bulkOperation {{
+                id
+                status
+            }}
+            userErrors {{
+                field
+                message
+            }}
+        }}
+    }}
+    '''
+    response = graphql_request(wrapper)
+    result = response["data"]["bulkOperationRunMutation"]
+    if result["userErrors"]:
+        raise ValueError(f"Bulk mutation rejected: {result['userErrors']}")
+    return result["bulkOperation"]["id"]
+
+
+def poll_bulk_operation(operation_id, poll_interval=POLL_INTERVAL):
+    """
+    Wait for a bulk operation to finish.
+
+    Returns:
+        str | None: URL of the result JSONL file, or None if there were no results
+    """
+    query = f"""
+    {{
+        node(id: "{operation_id}") {{
+            ... on BulkOperation {{
+                id
+                status
+                errorCode
+                objectCount
+                url
+            }}
+        }}
+    }}
+    """
+    while True:
+        operation = graphql_request(query)["data"]["node"]
+        status = operation["status"]
+        if status in FINISHED_STATUSES:
+            break
+        print(
+            f"Bulk operation {status.lower()}, "
+            f"objects so far: {operation['objectCount']}"
+        )
+        time.sleep(poll_interval)
+
+    if status != "COMPLETED":
+        raise ValueError(
+            f"Bulk operation {operation_id} {status.lower()}: {operation['errorCode']}"
+        )
+    print(f"Bulk operation completed with {operation['objectCount']} objects")
+    return operation["url"]
+
+
+def iter_jsonl(url):
+    """Stream a JSONL file line by line, yielding one parsed object per line."""
+    if url is None:
+        return
+    # The result URL is a signed storage link; don't send it our Shopify token.
+    with get_session().get(
+        url, stream=True, timeout=60, headers={"X-Shopify-Access-Token": None}
+    ) as response:
+        response.raise_for_status()
+        for line in response.iter_lines():
+            if line:
+                yield json.loads(line)
+
+
+def iter_bulk_pages(query, page_size, poll_interval=POLL_INTERVAL):
+    """
+    Run ``query`` as a bulk operation and yield its results in lists of
+    ``page_size`` objects, so callers written for paginated responses can
+    consume it with flat memory use.
+    """
+    url = poll_bulk_operation(run_bulk_query(query), poll_interval)
+    objects = iter_jsonl(url)
+    while page := list(islice(objects, page_size)):
+        yield page
+
+
+def iter_bulk_mutation_results(mutation, variables, poll_interval=POLL_INTERVAL):
+    """
+    Run ``mutation`` once for each set of ``variables`` as a bulk operation.
+
+    Yields:
+        dict: One result object per variables line, each carrying the
+        ``__lineNumber`` (0-based) of the variables it was run with
+    """
+    staged_upload_path = staged_upload_jsonl(variables)
+    operation_id = run_bulk_mutation(mutation, staged_upload_path)
+    yield from iter_jsonl(poll_bulk_operation(operation_id, poll_interval))
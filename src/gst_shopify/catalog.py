@@ -0,0 +1,188 @@
+from datetime import datetime, timedelta, timezone
+
+import typer
+from typing_extensions import Annotated
+
+from gst_shopify.hsn_query import QUERY_BATCH_SIZE, iter_variant_pages
+from gst_shopify.local_store import connect
+
+WATERMARK_KEY = "variants_updated_at"
+# The watermark is the refresh's start time less this margin, to allow for
+# clock skew with Shopify; re-fetching a few variants is harmless.
+WATERMARK_OVERLAP = timedelta(minutes=5)
+
+
+class CatalogMirror:
+    """
+    Local mirror of the catalog's variants: SKU, variant ID, inventory item
+    ID, HSN code and product status, kept current by refresh_catalog.
+
+    Pages read from the mirror have the same shape as productVariant nodes
+    from hsn_query, so reports and updates can use either source.
+    """
+
+    def __init__(self, conn=None):
+        self.conn = conn or connect()
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM variants").fetchone()[0]
+
+    @property
+    def watermark(self):
+        row = self.conn.execute(
+            "SELECT value FROM sync_state WHERE key = ?", (WATERMARK_KEY,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def save_page(self, variants):
+        """Upsert one page of variant nodes."""
+        if not variants:
+            return
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO variants (variant_id, sku, "
+                "inventory_item_id, hsn_code, product_status, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    (
+                        variant["id"],
+                        variant["sku"],
+                        variant["inventoryItem"]["id"],
+                        variant["inventoryItem"]["harmonizedSystemCode"],
+                        variant["product"]["status"],
+                        variant["updatedAt"],
+                    )
+                    for variant in variants
+                ),
+            )
+
+    def set_watermark(self, watermark):
+        """Record that every variant updated before ``watermark`` is mirrored."""
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO sync_state (key, value) VALUES (?, ?)",
+                (WATERMARK_KEY, watermark),
+            )
+
+    def remove_missing(self, variant_ids):
+        """
+        Delete the mirrored variants not in ``variant_ids``, the IDs seen by a
+        complete catalog scan.
+
+        Returns:
+            int: Number of variants deleted
+        """
+        with self.conn:
+            self.conn.execute(
+                "CREATE TEMP TABLE IF NOT EXISTS seen_variants "
+                "(variant_id TEXT PRIMARY KEY)"
+            )
+            self.conn.execute("DELETE FROM seen_variants")
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO seen_variants (variant_id) VALUES (?)",
+                ((variant_id,) for variant_id in variant_ids),
+            )
+            deleted = self.conn.execute(
+                "DELETE FROM variants WHERE variant_id NOT IN "
+                "(SELECT variant_id FROM seen_variants)"
+            ).rowcount
+            self.conn.execute("DELETE FROM seen_variants")
+        return deleted
+
+    def set_hsn_codes(self, inventory_item_ids, hsn_codes):
+        """Record HSN codes we have just written to Shopify ourselves."""
+        with self.conn:
+            self.conn.executemany(
+                "UPDATE variants SET hsn_code = ? WHERE inventory_item_id = ?",
+                zip(hsn_codes, inventory_item_ids),
+            )
+
+    def iter_variant_pages(self, page_size=QUERY_BATCH_SIZE):
+        """Yield the mirrored variants in pages of productVariant-shaped nodes."""
+        cursor = self.conn.execute(
+            "SELECT variant_id, sku, inventory_item_id, hsn_code, product_status, "
+            "updated_at FROM variants ORDER BY variant_id"
+        )
+        while rows := cursor.fetchmany(page_size):
+            yield [
+                {
+                    "id": variant_id,
+                    "sku": sku,
+                    "updatedAt": updated_at,
+                    "inventoryItem": {
+                        "id": inventory_item_id,
+                        "harmonizedSystemCode": hsn_code,
+                    },
+                    "product": {"status": product_status},
+                }
+                for (
+                    variant_id,
+                    sku,
+                    inventory_item_id,
+                    hsn_code,
+                    product_status,
+                    updated_at,
+                ) in rows
+            ]
+
+
+def refresh_catalog(mirror=None, full=False, bulk=False):
+    """
+    Bring the catalog mirror up to date with variants updated since the last
+    refresh (or the whole catalog on the first run or with ``full``).
+
+    HSN codes live on inventory items, and editing one outside these tools
+    does not always bump the variant's updatedAt; run with ``full``
+    periodically if HSN codes are also edited in the Shopify admin. A full
+    refresh also drops the variants that no longer exist in Shopify.
+
+    Variants do not come back in updatedAt order, so the watermark is only
+    moved (to the time the refresh started) once the whole scan has been
+    mirrored; an interrupted refresh is simply repeated next time.
+
+    Returns:
+        CatalogMirror: The refreshed mirror
+    """
+    if mirror is None:
+        mirror = CatalogMirror()
+    watermark = None if full else mirror.watermark
+    search = f"updated_at:>='{watermark}'" if watermark else None
+    print(f"Refreshing catalog mirror since {watermark or 'the beginning'}...")
+    started_at = datetime.now(timezone.utc) - WATERMARK_OVERLAP
+
+    total = 0
+    seen = set() if watermark is None else None
+    for variants in iter_variant_pages(bulk=bulk, search=search):
+        mirror.save_page(variants)
+        if seen is not None:
+            seen.update(variant["id"] for variant in variants)
+        total += len(variants)
+        print(f"Mirrored {total} variants")
+
+    if seen is not None:
+        deleted = mirror.remove_missing(seen)
+        if deleted:
+            print(f"Removed {deleted} variants no longer in the catalog")
+    mirror.set_watermark(started_at.strftime("%Y-%m-%dT%H:%M:%SZ"))
+    print(f"Catalog mirror refreshed: {total} variants fetched, {len(mirror)} mirrored")
+    return mirror
+
+
+app = typer.Typer(help="Refresh the local catalog mirror of variants and HSN codes")
+
+
+@app.command()
+def main(
+    full: Annotated[
+        bool, typer.Option("--full", help="Ignore the watermark and refetch all")
+    ] = False,
+    bulk: Annotated[
+        bool, typer.Option("--bulk", help="Fetch with a bulk operation")
+    ] = False,
+):
+    """Fetch variants updated since the last refresh into the catalog mirror"""
+    refresh_catalog(full=full, bulk=bulk)
+
+
+if __name__ == "__main__":
+    app()
@@ -0,0 +1,84 @@
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+
+SAVE_INTERVAL = 1.0  # minimum seconds between saves triggered by mark_done
+
+
+def file_key(path: Path):
+    """
+    Checkpoint key for a job reading ``path``: its name and a hash of its
+    contents, so a checkpoint is not resumed once the file has been edited.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while block := f.read(1 << 20):
+            digest.update(block)
+    return f"{path}:{digest.hexdigest()}"
+
+
+def write_atomic(path: Path, text):
+    """Write a text file so readers see either the old or the new content."""
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "w") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+class Checkpoint:
+    """
+    Progress of a long-running job, saved as JSON after every step so an
+    interrupted run can resume where it stopped.
+
+    Holds the last committed pagination ``cursor`` and the set of items
+    already ``done``. A checkpoint saved for a different ``key`` (e.g. another
+    input file) is ignored.
+
+    Done items are saved at most every ``save_interval`` seconds, as the
+    whole set is rewritten each time; call save() once the job stops. Items
+    lost in a crash are just processed again.
+    """
+
+    def __init__(self, path: Path, key=None, save_interval=SAVE_INTERVAL):
+        self.path = path
+        self.key = key
+        self.save_interval = save_interval
+        self.cursor = None
+        self.done = set()
+        self._saved_at = None
+        if path.exists():
+            self.load()
+
+    def load(self):
+        with open(self.path) as f:
+            state = json.load(f)
+        if state.get("key") != self.key:
+            print(f"Ignoring checkpoint {self.path} saved for {state.get('key')}")
+            return
+        self.cursor = state.get("cursor")
+        self.done = set(state.get("done", []))
+        print(f"Resuming from checkpoint {self.path}")
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        state = {"key": self.key, "cursor": self.cursor, "done": sorted(self.done)}
+        write_atomic(self.path, json.dumps(state))
+        self._saved_at = time.monotonic()
+
+    def set_cursor(self, cursor):
+        self.cursor = cursor
+        self.save()
+
+    def mark_done(self, item):
+        self.done.add(item)
+        if (
+            self._saved_at is None
+            or time.monotonic() - self._saved_at >= self.save_interval
+        ):
+            self.save()
+
+    def clear(self):
+        """Remove the checkpoint once the job has finished."""
+        self.path.unlink(missing_ok=True)
@@ -1,9 +1,13 @@
 from pathlib import Path
+from typing import Optional
 
 import typer
 from typing_extensions import Annotated
 
-from gst_shopify.e_invoice_exp_lut import generate_invoices
+from gst_shopify.catalog import refresh_catalog
+from gst_shopify.e_invoice_exp_lut import DEFAULT_WORKERS, generate_invoices
+from gst_shopify.hsn_cache import HsnCache, default_cache_path
+from gst_shopify.order_store import OrderStore
 
 app = typer.Typer(help="Generate GST e-invoices for Shopify orders")
 
@@ -14,9 +18,52 @@ def main(
     output_dir: Annotated[
         Path, typer.Option("--output", "-o", help="Directory for generated invoices")
     ] = Path("invoices"),
+    hsn_cache: Annotated[
+        bool,
+        typer.Option(
+            "--hsn-cache", help="Reuse HSN codes cached on disk by previous runs"
+        ),
+    ] = False,
+    prewarm_hsn: Annotated[
+        bool,
+        typer.Option(
+            "--prewarm-hsn",
+            help="Refresh the catalog mirror and load its HSN codes first",
+        ),
+    ] = False,
+    workers: Annotated[
+        int,
+        typer.Option(
+            "--workers", "-w", min=1, help="Number of orders fetched in parallel"
+        ),
+    ] = DEFAULT_WORKERS,
+    from_store: Annotated[
+        bool,
+        typer.Option(
+            "--from-store",
+            help="Read orders from the local store filled by sync-orders",
+        ),
+    ] = False,
+    processes: Annotated[
+        Optional[int],
+        typer.Option(
+            "--processes",
+            "-p",
+            min=1,
+            help="Build invoices on this many worker processes",
+        ),
+    ] = None,
 ):
     """Generate GST invoices for specified orders"""
-    generate_invoices(order_ids, output_dir)
+    cache = None
+    if hsn_cache or prewarm_hsn:
+        cache = HsnCache(path=default_cache_path() if hsn_cache else None)
+        if prewarm_hsn:
+            cache.prewarm(mirror=refresh_catalog())
+    store = OrderStore() if from_store else None
+    generate_invoices(order_ids, output_dir, cache, workers, store, processes)
+    if cache is not None:
+        cache.save()
 
 
 if __name__ == "__main__":
@@ -1,7 +1,14 @@
 import json
 import os
+from functools import cache
 from pathlib import Path
 from typing import Any, Dict
+from zoneinfo import ZoneInfo
+
+DEFAULT_POOL_SIZE = 10
+DEFAULT_MAX_CONCURRENCY = 4
+DEFAULT_TALLY_URL = "http://localhost:9000"
+DEFAULT_SHOP_TIMEZONE = "Asia/Kolkata"
 
 
 def load_seller_details(
@@ -17,6 +24,12 @@ def load_seller_details(
         return json.load(f)
 
 
+@cache
+def get_seller_details() -> Dict[str, Any]:
+    """Load seller details from the default configuration file, once per process"""
+    return load_seller_details()
+
+
 def get_shopify_credentials() -> tuple[str, str]:
     """Get Shopify store and API token from environment"""
     store = os.getenv("SHOPIFY_STORE")
@@ -28,3 +41,31 @@ def get_shopify_credentials() -> tuple[str, str]:
         )
 
     return store, token
+
+
+def get_pool_size() -> int:
+    """Get the HTTP connection pool size from environment"""
+    return int(os.getenv("SHOPIFY_POOL_SIZE", DEFAULT_POOL_SIZE))
+
+
+def get_max_concurrency() -> int:
+    """Get the maximum number of concurrent Shopify requests from environment"""
+    return int(os.getenv("SHOPIFY_MAX_CONCURRENCY", DEFAULT_MAX_CONCURRENCY))
+
+
+@cache
+def get_shop_timezone() -> ZoneInfo:
+    """Get the shop's timezone, for dating documents, from environment"""
+    return ZoneInfo(os.getenv("SHOP_TIMEZONE", DEFAULT_SHOP_TIMEZONE))
+
+
+def get_cache_dir() -> Path:
+    """Get the directory for local caches and stores from environment"""
+    return Path(
+        os.getenv("GST_SHOPIFY_CACHE_DIR", Path.home() / ".cache" / "gst-shopify")
+    )
+
+
+def get_tally_url() -> str:
+    """Get the URL of Tally's XML server from environment"""
+    return os.getenv("TALLY_URL", DEFAULT_TALLY_URL)
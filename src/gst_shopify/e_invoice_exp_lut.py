@@ -1,56 +1,49 @@
 import json
-import os
-from decimal import ROUND_HALF_UP, Decimal
+from datetime import datetime
+from decimal import Decimal
 from pathlib import Path
 
-import requests
-from dateutil import parser
-
-from gst_shopify.config import load_seller_details
-from gst_shopify.orders import get_order_ids_from_names
-
-SHOPIFY_STORE = os.getenv("SHOPIFY_STORE")
-API_TOKEN = os.getenv("API_TOKEN")
+from gst_shopify.api_client import get_session_stats
+from gst_shopify.checkpoint import Checkpoint, file_key, write_atomic
+from gst_shopify.config import get_seller_details, get_shop_timezone
+from gst_shopify.hsn_cache import should_fetch_hsn
+from gst_shopify.invoice_model import (
+    DEFAULT_HSN_CODE,
+    ONE,
+    SHIPPING_HSN_CODE,
+    ZERO,
+    Invoice,
+    InvoiceLine,
+    json_amount,
+    round_amount,
+)
+from gst_shopify.order_index import OrderIndex
+from gst_shopify.orders import (
+    E_INVOICE_ORDER_FIELDS,
+    get_order_ids_from_names,
+    iter_orders_details,
+)
+from gst_shopify.pipeline import OrderedWriter, process_chunks
 
 QUERY_BATCH_SIZE = 250
+DEFAULT_WORKERS = 4
+CHECKPOINT_FILE = ".gen-invoice-checkpoint.json"
 
 
-def get_shopify_order(order_id):
-    url = f"https://{SHOPIFY_STORE}/admin/api/2024-10/orders/{order_id}.json"
-    headers = {
-        "Content-Type": "application/json",
-        "X-Shopify-Access-Token": API_TOKEN,
-    }
-    response = requests.get(url, headers=headers)
-    response.raise_for_status()
-    return response.json()["order"]
-
-
-def get_inventory_item_id(variant_id):
-    url = f"https://{SHOPIFY_STORE}/admin/api/2024-10/variants/{variant_id}.json"
-    headers = {
-        "Content-Type": "application/json",
-        "X-Shopify-Access-Token": API_TOKEN,
-    }
-    response = requests.get(url, headers=headers)
-    response.raise_for_status()
-    return response.json()["variant"].get("inventory_item_id")
+def money_amount(obj, field):
+    """Read ``field { shopMoney { amount } }`` from a GraphQL payload."""
+    return ((obj.get(field) or {}).get("shopMoney") or {}).get("amount") or "0.00"
 
 
-def get_hsn_code(inventory_item_id):
-    url = f"https://{SHOPIFY_STORE}/admin/api/2024-10/inventory_items/{inventory_item_id}.json"
-    headers = {
-        "Content-Type": "application/json",
-        "X-Shopify-Access-Token": API_TOKEN,
-    }
-    response = requests.get(url, headers=headers)
-    response.raise_for_status()
-    return response.json()["inventory_item"].get("harmonized_system_code", "00000000")
+def line_item_hsn_code(line_item):
+    variant = line_item.get("variant") or {}
+    inventory_item = variant.get("inventoryItem") or {}
+    return inventory_item.get("harmonizedSystemCode") or DEFAULT_HSN_CODE
 
 
 def validate_order_total(shopify_order, calculated_line_items_total):
-    subtotal_price = Decimal(shopify_order.get("subtotal_price", "0.00"))
-    total_discounts = Decimal(shopify_order.get("total_discounts", "0.00"))
+    subtotal_price = Decimal(money_amount(shopify_order, "subtotalPriceSet"))
+    total_discounts = Decimal(money_amount(shopify_order, "totalDiscountsSet"))
     expected_total = subtotal_price - total_discounts
     tolerance = Decimal("0.01")
     if abs(calculated_line_items_total - expected_total) <= tolerance:
@@ -66,215 +59,326 @@ def validate_order_total(shopify_order, calculated_line_items_total):
     return False, discrepancy_report
 
 
-def get_latest_fulfillment_date(shopify_order):
-    """Get the latest fulfillment date from fulfilled line items"""
+def parse_timestamp(value):
+    """Parse a Shopify timestamp, trying the ISO 8601 fast path first."""
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        from dateutil import parser
+
+        return parser.parse(value)
+
+
+def get_latest_fulfillment_date(shopify_order, log=print):
+    """
+    Get the latest fulfillment date from fulfilled line items, as a date in
+    the shop's timezone (GraphQL timestamps are in UTC)
+    """
     latest_date = None
-    for item in shopify_order.get("fulfillments", []):
-        fulfillment_date = parser.parse(item.get("created_at"))
+    for item in shopify_order.get("fulfillments") or []:
+        fulfillment_date = parse_timestamp(item.get("createdAt"))
         if latest_date is None or fulfillment_date > latest_date:
             latest_date = fulfillment_date
     if latest_date is None:
-        latest_date = parser.parse(shopify_order["created_at"])
-        print(
+        latest_date = parse_timestamp(shopify_order["createdAt"])
+        log(
             f"Warning: No fulfillment date found for order {shopify_order['name']}, using order date"
         )
+    if latest_date.tzinfo is not None:
+        latest_date = latest_date.astimezone(get_shop_timezone())
     return latest_date.strftime("%d/%m/%Y")
 
 
-def generate_gst_invoice_data(shopify_order, seller_details):
-    shipping_amount = Decimal(
-        shopify_order.get("total_shipping_price_set", {})
-        .get("shop_money", {})
-        .get("amount", "0.00")
+def build_invoice(shopify_order, seller_details, log=print):
+    """
+    Build the e-invoice from a GraphQL order with (at least) the
+    orders.E_INVOICE_ORDER_FIELDS field set. HSN codes come from each line item's
+    variant.inventoryItem, so no further requests are needed. Warnings are
+    reported through ``log``.
+
+    Returns:
+        invoice_model.Invoice: The invoice (see Invoice.to_dict for the payload)
+    """
+    shipping_amount = Decimal(money_amount(shopify_order, "totalShippingPriceSet"))
+    total_discounts = Decimal(money_amount(shopify_order, "totalDiscountsSet"))
+    customer = shopify_order.get("customer") or {}
+    shipping_address = shopify_order.get("shippingAddress") or {}
+    invoice = Invoice(
+        number=str(shopify_order["name"]).replace("#", ""),
+        date=get_latest_fulfillment_date(shopify_order, log),
+        seller=seller_details,
+        buyer_name=(customer.get("firstName") or "")
+        + " "
+        + (customer.get("lastName") or ""),
+        address1=shipping_address.get("address1") or "",
+        address2=shipping_address.get("address2") or "",
+        city=shipping_address.get("city") or "",
     )
-    total_discounts = Decimal(
-        str(shopify_order.get("total_discounts", "0.00"))
-    )  # Get total discounts
-    invoice_data = {
-        "Version": "1.1",
-        "TranDtls": {
-            "TaxSch": "GST",
-            "SupTyp": "EXPWOP",
-            "IgstOnIntra": "N",
-            "RegRev": "N",
-            "EcmGstin": None,
-        },
-        "DocDtls": {
-            "Typ": "INV",
-            "No": str(shopify_order["name"]).replace("#", ""),
-            "Dt": get_latest_fulfillment_date(shopify_order),
-        },
-        "SellerDtls": seller_details,
-        "BuyerDtls": {
-            "Gstin": "URP",
-            "LglNm": shopify_order.get("customer", {}).get("first_name", "")
-            + " "
-            + shopify_order.get("customer", {}).get("last_name", ""),
-            "Pos": "96",
-            "Addr1": shopify_order.get("shipping_address", {}).get("address1", ""),
-            "Addr2": shopify_order.get("shipping_address", {}).get("address2", ""),
-            "Loc": shopify_order.get("shipping_address", {}).get("city", ""),
-            "Pin": 999999,
-            "Stcd": "96",
-            "Ph": None,
-            "Em": None,
-        },
-        "ItemList": [],
-        "ValDtls": {
-            "AssVal": Decimal("0.00"),
-            "CgstVal": Decimal("0.00"),
-            "SgstVal": Decimal("0.00"),
-            "IgstVal": Decimal("0.00"),
-            "CesVal": Decimal("0.00"),
-            "StCesVal": Decimal("0.00"),
-            "Discount": total_discounts,
-            "OthChrg": Decimal("0.00"),
-            "RndOffAmt": Decimal("0.00"),
-            "TotInvVal": Decimal("0.00"),
-        },
-    }
-
-    valid_item_count = 0
-    for idx, item in enumerate(shopify_order["line_items"]):
-        if item.get("fulfillment_status") != "fulfilled":
-            print(f"Skipping item {item.get('name')} - not fulfilled")
+
+    items_value = ZERO
+    items_discount = ZERO
+    for edge in shopify_order["lineItems"]["edges"]:
+        item = edge["node"]
+        if (item.get("fulfillmentStatus") or "").lower() != "fulfilled":
+            log(f"Skipping item {item.get('name')} - not fulfilled")
             continue
-        variant_id = item.get("variant_id")
-        inventory_item_id = get_inventory_item_id(variant_id) if variant_id else None
-        hsn_code = get_hsn_code(inventory_item_id) if inventory_item_id else "00000000"
         quantity = Decimal(str(item["quantity"]))
-        unit_price = Decimal(str(item["price"]))
-        discount_amount = Decimal(str(item.get("total_discount", "0.00")))
-        total_before_discount = (unit_price * quantity).quantize(
-            Decimal("0.00"), rounding=ROUND_HALF_UP
-        )
-        total_amount = (total_before_discount - discount_amount).quantize(
-            Decimal("0.00"), rounding=ROUND_HALF_UP
+        unit_price = Decimal(money_amount(item, "originalUnitPriceSet"))
+        discount_amount = Decimal(money_amount(item, "totalDiscountSet"))
+        total_before_discount = round_amount(unit_price * quantity)
+        total_amount = round_amount(total_before_discount - discount_amount)
+        invoice.items.append(
+            InvoiceLine(
+                sl_no=len(invoice.items) + 1,
+                description=item["title"],
+                hsn_code=line_item_hsn_code(item),
+                quantity=quantity,
+                unit_price=unit_price,
+                amount=total_before_discount,
+                discount=discount_amount,
+                value=total_amount,
+            )
         )
-
-        invoice_data["ItemList"].append(
-            {
-                "SlNo": str(valid_item_count + 1),
-                "PrdDesc": item["title"],
-                "IsServc": "N",
-                "HsnCd": hsn_code,
-                "Qty": quantity,
-                "FreeQty": Decimal("0.00"),
-                "Unit": "NOS",
-                "UnitPrice": unit_price,
-                "TotAmt": total_before_discount,
-                "Discount": discount_amount,
-                "PreTaxVal": total_amount,
-                "AssAmt": total_amount,
-                "GstRt": Decimal("0.00"),
-                "IgstAmt": Decimal("0.00"),
-                "CgstAmt": Decimal("0.00"),
-                "SgstAmt": Decimal("0.00"),
-                "CesRt": Decimal("0.00"),
-                "CesAmt": Decimal("0.00"),
-                "CesNonAdvlAmt": Decimal("0.00"),
-                "StateCesRt": Decimal("0.00"),
-                "StateCesAmt": Decimal("0.00"),
-                "StateCesNonAdvlAmt": Decimal("0.00"),
-                "OthChrg": Decimal("0.00"),
-                "TotItemVal": total_amount,
-            }
+        items_value += total_amount
+        items_discount += discount_amount
+
+    if shipping_amount > ZERO:
+        invoice.items.append(
+            InvoiceLine(
+                sl_no=len(invoice.items) + 1,
+                description="Shipping Charges",
+                hsn_code=SHIPPING_HSN_CODE,
+                quantity=ONE,
+                unit_price=shipping_amount,
+                amount=shipping_amount,
+                discount=ZERO,
+                value=shipping_amount,
+                is_service=True,
+                unit="OTH",
+            )
         )
-        invoice_data["ValDtls"]["AssVal"] += total_amount
-        invoice_data["ValDtls"]["TotInvVal"] += total_amount
-        invoice_data["ValDtls"]["Discount"] += discount_amount
-        valid_item_count += 1
-
-    if shipping_amount > Decimal("0.00"):
-        shipping_line_item = {
-            "SlNo": str(valid_item_count + 1),
-            "PrdDesc": "Shipping Charges",
-            "IsServc": "Y",
-            "HsnCd": "996811",
-            "Qty": Decimal("1.00"),
-            "FreeQty": Decimal("0.00"),
-            "Unit": "OTH",
-            "UnitPrice": shipping_amount,
-            "TotAmt": shipping_amount,
-            "Discount": Decimal("0.00"),
-            "PreTaxVal": shipping_amount,
-            "AssAmt": shipping_amount,
-            "GstRt": Decimal("0.00"),
-            "IgstAmt": Decimal("0.00"),
-            "CgstAmt": Decimal("0.00"),
-            "SgstAmt": Decimal("0.00"),
-            "CesRt": Decimal("0.00"),
-            "CesAmt": Decimal("0.00"),
-            "CesNonAdvlAmt": Decimal("0.00"),
-            "StateCesRt": Decimal("0.00"),
-            "StateCesAmt": Decimal("0.00"),
-            "StateCesNonAdvlAmt": Decimal("0.00"),
-            "OthChrg": Decimal("0.00"),
-            "TotItemVal": shipping_amount,
-        }
-    invoice_data["ItemList"].append(shipping_line_item)
-    invoice_data["ValDtls"]["AssVal"] += shipping_amount
-    invoice_data["ValDtls"]["AssVal"] = invoice_data["ValDtls"]["AssVal"].quantize(
-        Decimal("0.00"), rounding=ROUND_HALF_UP
-    )
-    invoice_data["ValDtls"]["TotInvVal"] += shipping_amount - total_discounts
-    invoice_data["ValDtls"]["TotInvVal"] = invoice_data["ValDtls"][
-        "TotInvVal"
-    ].quantize(Decimal("0.00"), rounding=ROUND_HALF_UP)
-    if not invoice_data["ItemList"]:
+    if not invoice.items:
         raise ValueError(
             f"Order {shopify_order['name']} has no valid items for invoice generation"
         )
-    return invoice_data
+    invoice.assessable_value = round_amount(items_value + shipping_amount)
+    invoice.discount = total_discounts + items_discount
+    invoice.total_value = round_amount(items_value + shipping_amount - total_discounts)
+    return invoice
+
+
+def generate_gst_invoice_data(shopify_order, seller_details, log=print):
+    """
+    Build the e-invoice payload (a dict with Decimal amounts) from a GraphQL
+    order; see build_invoice.
+    """
+    return build_invoice(shopify_order, seller_details, log).to_dict()
 
 
 def decimal_default(obj):
     if isinstance(obj, Decimal):
-        val = obj.quantize(Decimal("0.00"), rounding=ROUND_HALF_UP)
-        if val == val.to_integral_value():
-            return int(val)
-        return float(val)
+        return json_amount(obj)
     return str(obj)
 
 
-def save_invoice_to_json(out_dir: Path, invoice_data, name):
+def invoice_to_json(invoice):
+    """Serialize an invoice_model.Invoice (or an e-invoice payload dict)."""
+    if isinstance(invoice, Invoice):
+        invoice = invoice.to_dict(as_json=True)
+    return json.dumps([invoice], indent=4, default=decimal_default)
+
+
+def write_invoice_json(out_dir: Path, text, name):
     out_dir.mkdir(parents=True, exist_ok=True)
     file_name = out_dir / f"exp_invoice_{name}.json"
-    with open(file_name, "w") as json_file:
-        json.dump([invoice_data], json_file, indent=4, default=decimal_default)
+    write_atomic(file_name, text)
     print(f"GST export e-invoice (LUT) saved as {file_name}")
 
 
-def create_e_invoice_lut(out_dir: Path, order_id):
-    seller_details = load_seller_details()
-    shopify_order = get_shopify_order(order_id)
-    return generate_gst_invoice_data(shopify_order, seller_details)
+def save_invoice_to_json(out_dir: Path, invoice_data, name):
+    write_invoice_json(out_dir, invoice_to_json(invoice_data), name)
+
+
+_worker_seller_details = None
+
+
+def _init_invoice_worker(seller_details):
+    global _worker_seller_details
+    _worker_seller_details = seller_details
 
 
-def generate_invoices(input_file: Path, out_dir: Path):
-    """Generate invoices from a file containing order names"""
+def render_invoices(orders):
+    """
+    Build and serialize the invoices for a chunk of (name, order) pairs.
+
+    Runs in the worker processes started by generate_invoices, so messages
+    are collected and returned for the parent to print in order.
+
+    Returns:
+        list: (name, JSON text or None on error, messages) per order
+    """
+    results = []
+    for name, shopify_order in orders:
+        messages = [f"Processing order {name}"]
+        try:
+            invoice = build_invoice(
+                shopify_order, _worker_seller_details, messages.append
+            )
+            text = invoice_to_json(invoice)
+        except Exception as e:
+            messages.append(f"Error generating invoice for order {name}: {e}")
+            text = None
+        results.append((name, text, messages))
+    return results
+
+
+def _save_invoice(
+    out_dir: Path, invoice_data, name, checkpoint, save=save_invoice_to_json
+):
+    try:
+        save(out_dir, invoice_data, name)
+    except Exception as e:
+        print(f"Error generating invoice for order {name}: {e}")
+        return
+    checkpoint.mark_done(name)
+
+
+def _iter_named_orders(orders, id_to_name, log):
+    """
+    Yield (name, order) for fetched orders, reporting the ones that could not
+    be fetched.
+    """
+    for order_id, shopify_order, error in orders:
+        name = id_to_name[order_id]
+        if error is not None:
+            log(f"Error generating invoice for order {name}: {error}")
+            continue
+        yield name, shopify_order
+
+
+def generate_invoices(
+    input_file: Path,
+    out_dir: Path,
+    hsn_cache=None,
+    workers=DEFAULT_WORKERS,
+    store=None,
+    processes=None,
+):
+    """
+    Generate invoices from a file containing order names
+
+    Orders are fetched in cost-budgeted nodes(ids:) chunks by up to
+    ``workers`` threads, invoices are built on the main thread, and files are
+    written by a separate writer thread. Output appears in input order.
+
+    If an hsn_cache.HsnCache is given, HSN codes are taken from it (and it is
+    filled from the orders as they are fetched); codes it does not have are
+    fetched once per chunk of orders. If an order_store.OrderStore
+    is given, names and orders are read from it without any API calls, and
+    names missing from it are reported and skipped.
+
+    With ``processes``, invoices are built and serialized in chunks on that
+    many worker processes instead of the main thread, so the CPU-bound part
+    scales with cores (most useful with a store, where nothing waits on the
+    network).
+
+    Each invoice file is written atomically and then recorded in a
+    checkpoint in ``out_dir``, so rerunning an interrupted batch only
+    processes the orders that are not done yet. The checkpoint is removed
+    once every order in the file has been written.
+    """
     try:
         # Read order names from file
         with open(input_file, "r") as file:
             order_names = [line.strip() for line in file if line.strip()]
 
+        checkpoint = Checkpoint(out_dir / CHECKPOINT_FILE, file_key(input_file))
+        if checkpoint.done:
+            print(f"Skipping {len(checkpoint.done)} orders already done")
+            order_names = [name for name in order_names if name not in checkpoint.done]
+
         print(f"Looking up IDs for {len(order_names)} orders...")
 
         try:
             # First get all order IDs
-            name_to_id = get_order_ids_from_names(order_names)
-
-            # Then generate invoices using existing functions
-            for name, order_id in name_to_id.items():
-                print(f"Processing order {name}")
-                try:
-                    invoice = create_e_invoice_lut(out_dir, order_id)
-                    save_invoice_to_json(out_dir, invoice, name)
-                except Exception as e:
-                    print(f"Error generating invoice for order {name}: {e}")
-                    continue
-
-            print("All invoices generated successfully.")
+            if store is not None:
+                name_to_id = store.get_order_ids(order_names)
+                for name in order_names:
+                    if name not in name_to_id:
+                        print(
+                            f"Order {name} is not in the local store; run sync-orders"
+                        )
+            else:
+                name_to_id = get_order_ids_from_names(order_names, index=OrderIndex())
+            id_to_name = {order_id: name for name, order_id in name_to_id.items()}
+            seller_details = get_seller_details()
+
+            # Then fetch, build and write invoices as a pipeline
+            if store is not None:
+                orders = store.iter_orders_details(name_to_id.values())
+            else:
+                include_hsn = should_fetch_hsn(hsn_cache)
+                orders = iter_orders_details(
+                    name_to_id.values(),
+                    include_hsn,
+                    workers,
+                    E_INVOICE_ORDER_FIELDS,
+                    hsn_cache,
+                )
+            with OrderedWriter() as writer:
+                named_orders = _iter_named_orders(orders, id_to_name, writer.print)
+                if processes:
+                    chunks = process_chunks(
+                        render_invoices,
+                        named_orders,
+                        processes,
+                        initializer=_init_invoice_worker,
+                        initargs=(seller_details,),
+                    )
+                    for results in chunks:
+                        for name, text, messages in results:
+                            for message in messages:
+                                writer.print(message)
+                            if text is not None:
+                                writer.submit(
+                                    _save_invoice,
+                                    out_dir,
+                                    text,
+                                    name,
+                                    checkpoint,
+                                    write_invoice_json,
+                                )
+                else:
+                    for name, shopify_order in named_orders:
+                        writer.print(f"Processing order {name}")
+                        try:
+                            invoice = build_invoice(
+                                shopify_order, seller_details, writer.print
+                            )
+                        except Exception as e:
+                            writer.print(
+                                f"Error generating invoice for order {name}: {e}"
+                            )
+                            continue
+                        writer.submit(_save_invoice, out_dir, invoice, name, checkpoint)
+
+            if all(name in checkpoint.done for name in order_names):
+                checkpoint.clear()
+                print("All invoices generated successfully.")
+            else:
+                checkpoint.save()
+                print(
+                    "Some invoices could not be generated; rerun to retry only "
+                    f"those (progress is kept in {checkpoint.path})"
+                )
+            stats = get_session_stats()
+            print(
+                f"HTTP requests: {stats['requests']}, "
+                f"connections opened: {stats['connections']}, "
+                f"reused: {stats['reused']}"
+            )
+            if hsn_cache is not None:
+                print(f"HSN cache hits: {hsn_cache.hits}, misses: {hsn_cache.misses}")
 
         except ValueError as e:
             print(f"Error looking up orders: {e}")
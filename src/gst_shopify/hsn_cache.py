@@ -0,0 +1,212 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from gst_shopify.api_client import graphql_request
+from gst_shopify.config import get_cache_dir
+from gst_shopify.hsn_query import iter_variant_pages
+
+DEFAULT_MAX_SIZE = 50_000
+DEFAULT_TTL = 24 * 60 * 60  # seconds a persisted entry stays valid
+NODES_BATCH_SIZE = 250  # nodes(ids:) accepts at most 250 IDs
+
+
+def default_cache_path():
+    return get_cache_dir() / "hsn_cache.json"
+
+
+class HsnCache:
+    """
+    Bounded LRU cache of variant ID -> (inventory item ID, HSN code).
+
+    Entries can optionally be persisted to ``path`` between runs; entries
+    older than ``ttl`` seconds are dropped when the file is loaded.
+    hsn_update records the codes it writes in the persisted cache, so
+    corrections take effect without waiting for the entries to expire.
+    """
+
+    def __init__(self, max_size=DEFAULT_MAX_SIZE, path=None, ttl=DEFAULT_TTL):
+        self.max_size = max_size
+        self.path = path
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.prewarmed = False
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        if path is not None:
+            self.load()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, variant_id):
+        """Return (inventory_item_id, hsn_code) for a variant, or None."""
+        with self._lock:
+            entry = self._entries.get(variant_id)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(variant_id)
+            self.hits += 1
+            return entry[0], entry[1]
+
+    def put(self, variant_id, inventory_item_id, hsn_code, fetched_at=None):
+        with self._lock:
+            self._entries[variant_id] = (
+                inventory_item_id,
+                hsn_code,
+                fetched_at or time.time(),
+            )
+            self._entries.move_to_end(variant_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def set_hsn_codes(self, inventory_item_ids, hsn_codes):
+        """Record HSN codes we have just written to Shopify ourselves."""
+        codes = dict(zip(inventory_item_ids, hsn_codes))
+        with self._lock:
+            changed = [
+                (variant_id, entry)
+                for variant_id, entry in self._entries.items()
+                if entry[0] in codes
+            ]
+            for variant_id, (inventory_item_id, _, fetched_at) in changed:
+                self._entries[variant_id] = (
+                    inventory_item_id,
+                    codes[inventory_item_id],
+                    fetched_at,
+                )
+        return len(changed)
+
+    def load(self):
+        if not self.path.exists():
+            return
+        oldest = time.time() - self.ttl
+        with open(self.path) as f:
+            entries = json.load(f)
+        for variant_id, (inventory_item_id, hsn_code, fetched_at) in entries.items():
+            if fetched_at >= oldest:
+                self.put(variant_id, inventory_item_id, hsn_code, fetched_at)
+        print(f"Loaded {len(self)} cached HSN codes from {self.path}")
+
+    def save(self):
+        if self.path is None:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(".tmp")
+        with self._lock:
+            entries = {k: list(v) for k, v in self._entries.items()}
+        with open(tmp_path, "w") as f:
+            json.dump(entries, f)
+        os.replace(tmp_path, self.path)
+
+    def prewarm(self, bulk=False, mirror=None):
+        """
+        Load the whole variant -> HSN mapping from a catalog scan, or from a
+        catalog.CatalogMirror if one is given.
+        """
+        for variants in iter_variant_pages(bulk=bulk, mirror=mirror):
+            for variant in variants:
+                inventory_item = variant["inventoryItem"]
+                self.put(
+                    variant["id"],
+                    inventory_item["id"],
+                    inventory_item["harmonizedSystemCode"],
+                )
+        self.prewarmed = True
+        print(f"HSN cache prewarmed with {len(self)} variants")
+
+
+def should_fetch_hsn(cache):
+    """
+    Whether order queries should ask for line items' HSN codes: yes unless
+    the cache was prewarmed from the whole catalog or holds codes loaded from
+    disk. Cache misses are then fetched by fill_orders_hsn_codes, once per
+    chunk of orders.
+    """
+    return cache is None or not (cache.prewarmed or len(cache))
+
+
+def fetch_inventory_items(variant_ids):
+    """
+    Fetch inventory items for many variants with batched nodes(ids:) queries.
+
+    Returns:
+        dict: Mapping of variant ID to its inventoryItem payload
+    """
+    inventory_items = {}
+    for i in range(0, len(variant_ids), NODES_BATCH_SIZE):
+        ids = ", ".join(f'"{v}"' for v in variant_ids[i : i + NODES_BATCH_SIZE])
+        query = f"""
+        {{
+            nodes(ids: [{ids}]) {{
+                ... on ProductVariant {{
+                    id
+                    inventoryItem {{
+                        id
+                        harmonizedSystemCode
+                    }}
+                }}
+            }}
+        }}
+        """
+        response = graphql_request(query)
+        for node in response["data"]["nodes"]:
+            if node:
+                inventory_items[node["id"]] = node["inventoryItem"]
+    return inventory_items
+
+
+def fill_orders_hsn_codes(orders, cache):
+    """
+    Make sure every line item variant in several order payloads carries its
+    inventoryItem, using the cache for payloads fetched without it.
+
+    HSN codes already present in the payloads are recorded in the cache;
+    variants missing from both are fetched together in batched queries, so
+    a chunk of orders costs at most one nodes(ids:) request per 250 misses.
+    """
+    missing = []
+    for order in orders:
+        for edge in order.get("lineItems", {}).get("edges", []):
+            variant = edge["node"].get("variant")
+            if not variant:
+                continue
+            inventory_item = variant.get("inventoryItem")
+            if inventory_item is not None:
+                cache.put(
+                    variant["id"],
+                    inventory_item.get("id"),
+                    inventory_item.get("harmonizedSystemCode"),
+                )
+                continue
+            entry = cache.get(variant["id"])
+            if entry is None:
+                missing.append(variant)
+                continue
+            variant["inventoryItem"] = {
+                "id": entry[0],
+                "harmonizedSystemCode": entry[1],
+            }
+
+    if missing:
+        variant_ids = list(dict.fromkeys(variant["id"] for variant in missing))
+        fetched = fetch_inventory_items(variant_ids)
+        for variant in missing:
+            inventory_item = fetched.get(variant["id"]) or {}
+            variant["inventoryItem"] = inventory_item
+            cache.put(
+                variant["id"],
+                inventory_item.get("id"),
+                inventory_item.get("harmonizedSystemCode"),
+            )
+    return orders
+
+
+def fill_hsn_codes(order, cache):
+    """Fill in the HSN codes of one order payload; see fill_orders_hsn_codes."""
+    fill_orders_hsn_codes([order], cache)
+    return order
@@ -1,20 +1,30 @@
+import csv
+import json
+from collections import Counter
 from pathlib import Path
 
-import pandas as pd
+import typer
+from typing_extensions import Annotated
 
 from gst_shopify.api_client import graphql_request
+from gst_shopify.bulk_operations import iter_bulk_pages
 
 QUERY_BATCH_SIZE = 250
+SKU_LOOKUP_BATCH_SIZE = 50  # SKUs per productVariants search
+ACTIVE_PRODUCTS_SEARCH = "-product_status:archived"
 
 
-def generate_inventory_query(first=50, after=None):
+def generate_inventory_query(first=50, after=None, search=None):
     after_str = f', after: "{after}"' if after else ""
+    search_str = f', query: "{search}"' if search else ""
     return f"""
     query {{
-        productVariants(first: {first}{after_str}) {{
+        productVariants(first: {first}{after_str}{search_str}) {{
             edges {{
                 node {{
+                    id
                     sku
+                    updatedAt
                     inventoryItem {{
                         id
                         harmonizedSystemCode
@@ -33,92 +43,228 @@ def generate_inventory_query(first=50, after=None):
     """
 
 
-def get_unique_hsn_codes():
-    """Fetch all products and return a list of unique HSN codes."""
-    unique_hsn_codes = set()
-    has_next_page = True
-    end_cursor = None
-    page_count = 0
+def generate_bulk_inventory_query(search=None):
+    search_str = f'(query: "{search}")' if search else ""
+    return f"""
+    {{
+        productVariants{search_str} {{
+            edges {{
+                node {{
+                    id
+                    sku
+                    updatedAt
+                    inventoryItem {{
+                        id
+                        harmonizedSystemCode
+                    }}
+                    product {{
+                        status
+                    }}
+                }}
+            }}
+        }}
+    }}
+    """
+
+
+def iter_variant_pages(
+    page_size=QUERY_BATCH_SIZE, bulk=False, search=None, mirror=None
+):
+    """
+    Yield pages of productVariant nodes for the whole catalog (or the
+    variants matching a ``search`` query).
+
+    With a ``mirror`` (catalog.CatalogMirror) the pages are read from the
+    local catalog mirror without any API calls. With ``bulk`` the catalog is
+    exported through a single bulk operation and its JSONL result is streamed
+    back in ``page_size`` chunks; otherwise the catalog is paged through with
+    cursors.
+    """
+    if mirror is not None:
+        yield from mirror.iter_variant_pages(page_size)
+        return
+    if bulk:
+        yield from iter_bulk_pages(generate_bulk_inventory_query(search), page_size)
+        return
+
+    for variants, _ in iter_variant_cursor_pages(page_size, search):
+        yield variants
+
 
+def iter_variant_cursor_pages(page_size=QUERY_BATCH_SIZE, search=None, after=None):
+    """
+    Page through productVariants with cursors, starting ``after`` a cursor
+    if given.
+
+    Yields:
+        tuple: (list of productVariant nodes, end cursor of the page)
+    """
+    has_next_page = True
+    end_cursor = after
     while has_next_page:
-        query = generate_inventory_query(first=QUERY_BATCH_SIZE, after=end_cursor)
+        query = generate_inventory_query(
+            first=page_size, after=end_cursor, search=search
+        )
         response = graphql_request(query)
 
         product_variants = response["data"]["productVariants"]["edges"]
         page_info = response["data"]["productVariants"]["pageInfo"]
+        has_next_page = page_info["hasNextPage"]
+        end_cursor = page_info["endCursor"]
 
-        for variant in product_variants:
-            hsn_code = variant["node"]["inventoryItem"]["harmonizedSystemCode"]
-            if hsn_code:
-                unique_hsn_codes.add(hsn_code)
+        yield [variant["node"] for variant in product_variants], end_cursor
 
-        page_count += 1
-        print(
-            f"Processed page {page_count}, unique HSN codes found: {len(unique_hsn_codes)}"
+
+def get_variant_count(search=None):
+    """Return the number of product variants (matching ``search``, if given)."""
+    search_str = f'(query: "{search}")' if search else ""
+    response = graphql_request(f"{{ productVariantsCount{search_str} {{ count }} }}")
+    return response["data"]["productVariantsCount"]["count"]
+
+
+def iter_sku_variant_pages(skus, page_size=QUERY_BATCH_SIZE):
+    """
+    Yield pages of productVariant nodes for the given SKUs only, looked up
+    ``SKU_LOOKUP_BATCH_SIZE`` SKUs at a time with ``sku:A OR sku:B`` searches.
+
+    The search may also match other SKUs; callers should check each node.
+    """
+    skus = list(skus)
+    for i in range(0, len(skus), SKU_LOOKUP_BATCH_SIZE):
+        # Quote each SKU for the search syntax, then escape the whole search
+        # for the GraphQL string it is embedded in.
+        search = " OR ".join(
+            f"sku:{json.dumps(str(sku))}" for sku in skus[i : i + SKU_LOOKUP_BATCH_SIZE]
         )
+        yield from iter_variant_pages(page_size, search=json.dumps(search)[1:-1])
 
-        has_next_page = page_info["hasNextPage"]
-        end_cursor = page_info["endCursor"]
 
+def is_valid_hsn_code(hsn_code):
+    return bool(hsn_code) and len(hsn_code) in {6, 8}
+
+
+def iter_hsn_code_pages(bulk=False, mirror=None):
+    """
+    Yield pages of (sku, hsn_code) pairs for the variants of non-archived
+    products.
+
+    Archived products are filtered out by the search query, or skipped when
+    reading from a mirror (which keeps them so it can track status changes).
+    """
+    for variants in iter_variant_pages(
+        bulk=bulk, search=ACTIVE_PRODUCTS_SEARCH, mirror=mirror
+    ):
+        yield [
+            (variant["sku"], variant["inventoryItem"]["harmonizedSystemCode"])
+            for variant in variants
+            if variant["product"]["status"] != "ARCHIVED"
+        ]
+
+
+def get_unique_hsn_codes(bulk=False, mirror=None):
+    """Fetch all non-archived products and return a list of unique HSN codes."""
+    unique_hsn_codes = set()
+    for variants in iter_hsn_code_pages(bulk, mirror):
+        unique_hsn_codes.update(hsn_code for _, hsn_code in variants if hsn_code)
     return sorted(unique_hsn_codes)
 
 
-def list_invalid_hsn_codes():
+def list_invalid_hsn_codes(bulk=False, mirror=None):
     """List all product variants with empty, blank, or invalid HSN codes."""
-    invalid_hsn_variants = []
-    has_next_page = True
-    end_cursor = None
-    page_count = 0
-
-    while has_next_page:
-        query = generate_inventory_query(first=QUERY_BATCH_SIZE, after=end_cursor)
-        response = graphql_request(query)
+    return [
+        {"sku": sku, "hsn_code": hsn_code or "Blank"}
+        for variants in iter_hsn_code_pages(bulk, mirror)
+        for sku, hsn_code in variants
+        if not is_valid_hsn_code(hsn_code)
+    ]
 
-        product_variants = response["data"]["productVariants"]["edges"]
-        page_info = response["data"]["productVariants"]["pageInfo"]
 
-        for variant in product_variants:
-            product_status = variant["node"]["product"]["status"]
-            if product_status == "ARCHIVED":
-                continue  # Skip archived products
-
-            sku = variant["node"]["sku"]
-            hsn_code = variant["node"]["inventoryItem"]["harmonizedSystemCode"]
-
-            if not hsn_code or len(hsn_code) not in {6, 8}:
-                invalid_hsn_variants.append(
-                    {
-                        "sku": sku,
-                        "hsn_code": hsn_code or "Blank",
-                    }
-                )
-
-        page_count += 1
-        print(
-            f"Processed page {page_count}, invalid HSN codes found so far: {len(invalid_hsn_variants)}"
-        )
+def save_hsn_report(
+    output_file: Path,
+    invalid_file: Path,
+    counts_file: Path,
+    bulk=False,
+    mirror=None,
+):
+    """
+    Scan the catalog once and save the unique HSN codes, the variants with
+    invalid HSN codes and the number of variants per HSN code to CSV.
 
-        has_next_page = page_info["hasNextPage"]
-        end_cursor = page_info["endCursor"]
+    Unique codes (in the order they are first seen) and invalid variants are
+    written and flushed page by page, so an interrupted scan leaves partial
+    reports behind; the per-code counts are written once the scan completes.
+    """
+    hsn_code_counts = Counter()
+    invalid_count = 0
 
-    return invalid_hsn_variants
+    with (
+        open(output_file, "w", newline="") as unique_f,
+        open(invalid_file, "w", newline="") as invalid_f,
+    ):
+        unique_writer = csv.writer(unique_f)
+        unique_writer.writerow(["HSN_Code"])
+        invalid_writer = csv.writer(invalid_f)
+        invalid_writer.writerow(["sku", "hsn_code"])
 
+        for page_count, variants in enumerate(iter_hsn_code_pages(bulk, mirror), 1):
+            for sku, hsn_code in variants:
+                if hsn_code:
+                    if hsn_code not in hsn_code_counts:
+                        unique_writer.writerow([hsn_code])
+                    hsn_code_counts[hsn_code] += 1
+                if not is_valid_hsn_code(hsn_code):
+                    invalid_writer.writerow([sku, hsn_code or "Blank"])
+                    invalid_count += 1
+            unique_f.flush()
+            invalid_f.flush()
+            print(
+                f"Processed page {page_count}, unique HSN codes: "
+                f"{len(hsn_code_counts)}, invalid HSN codes: {invalid_count}"
+            )
 
-def save_unique_hsn_codes_to_csv(output_file: Path):
-    """Fetch unique HSN codes and save them to a CSV file."""
-    unique_hsn_codes = get_unique_hsn_codes()
-    unique_hsn_df = pd.DataFrame(unique_hsn_codes, columns=["HSN_Code"])
-    unique_hsn_df.to_csv(output_file, index=False)
     print(f"Unique HSN codes saved to {output_file}")
+    print(f"Invalid HSN codes saved to {invalid_file}")
+
+    with open(counts_file, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["HSN_Code", "variant_count"])
+        writer.writerows(sorted(hsn_code_counts.items()))
+    print(f"HSN code counts saved to {counts_file}")
+
+
+app = typer.Typer(help="Report unique and invalid HSN codes in the catalog")
+
 
+@app.command()
+def main(
+    output_file: Annotated[
+        Path, typer.Option("--output-file", help="CSV file for unique HSN codes")
+    ] = Path("unique_hsn_codes.csv"),
+    invalid_file: Annotated[
+        Path, typer.Option("--invalid-file", help="CSV file for invalid HSN codes")
+    ] = Path("bad_variants.csv"),
+    counts_file: Annotated[
+        Path,
+        typer.Option("--counts-file", help="CSV file for variant counts per HSN code"),
+    ] = Path("hsn_code_counts.csv"),
+    bulk: Annotated[
+        bool, typer.Option("--bulk", help="Export the catalog with a bulk operation")
+    ] = False,
+    local: Annotated[
+        bool,
+        typer.Option(
+            "--local", help="Refresh the local catalog mirror and report from it"
+        ),
+    ] = False,
+):
+    """Save unique HSN codes, invalid HSN codes and per-code counts to CSV"""
+    mirror = None
+    if local:
+        from gst_shopify.catalog import refresh_catalog
 
-def save_variants_to_csv(output_file="bad_variants.csv"):
-    invalid_hsn_codes = list_invalid_hsn_codes()
-    invalid_hsn_df = pd.DataFrame(invalid_hsn_codes, columns=["sku", "hsn_code"])
-    invalid_hsn_df.to_csv(output_file, index=False)
-    print(f"Invalid HSN codes saved to {output_file}")
+        mirror = refresh_catalog(bulk=bulk)
+    save_hsn_report(output_file, invalid_file, counts_file, bulk, mirror)
 
 
 if __name__ == "__main__":
-    save_unique_hsn_codes_to_csv()
-    save_variants_to_csv()
+    app()
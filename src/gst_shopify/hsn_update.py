@@ -1,35 +1,43 @@
-import time
+import csv
+import math
 from pathlib import Path
 
-import pandas as pd
+import typer
+from typing_extensions import Annotated
 
-from gst_shopify.api_client import graphql_request
+from gst_shopify.api_client import graphql_request, throttler
+from gst_shopify.bulk_operations import iter_bulk_mutation_results
+from gst_shopify.catalog import refresh_catalog
+from gst_shopify.checkpoint import Checkpoint, file_key
+from gst_shopify.hsn_cache import HsnCache, default_cache_path
+from gst_shopify.hsn_query import (
+    SKU_LOOKUP_BATCH_SIZE,
+    get_variant_count,
+    iter_sku_variant_pages,
+    iter_variant_cursor_pages,
+    iter_variant_pages,
+)
+from gst_shopify.pipeline import read_ahead
+from gst_shopify.throttle import SINGLE_QUERY_COST_LIMIT
 
 QUERY_BATCH_SIZE = 250  # Larger batch size for queries
-UPDATE_BATCH_SIZE = 3  # Smaller batch size for updates
+UPDATE_BATCH_SIZE = 3  # Initial batch size for updates, tuned at runtime
+CSV_CHUNK_SIZE = 10_000  # Input rows read at a time
 
-
-def generate_inventory_query(first=50, after=None):
-    after_str = f', after: "{after}"' if after else ""
-    return f"""
-    query {{
-        productVariants(first: {first}{after_str}) {{
-            edges {{
-                node {{
-                    sku
-                    inventoryItem {{
-                        id
-                        harmonizedSystemCode
-                    }}
-                }}
-            }}
-            pageInfo {{
-                hasNextPage
-                endCursor
-            }}
-        }}
-    }}
-    """
+HSN_BULK_MUTATION = """
+mutation updateHsnCode($id: ID!, $input: InventoryItemInput!) {
+    inventoryItemUpdate(id: $id, input: $input) {
+        inventoryItem {
+            id
+            harmonizedSystemCode
+        }
+        userErrors {
+            field
+            message
+        }
+    }
+}
+"""
 
 
 def generate_hsn_mutation(inventory_item_id, hsn_code, index):
@@ -45,77 +53,339 @@ def generate_hsn_mutation(inventory_item_id, hsn_code, index):
             harmonizedSystemCode
         }}
         userErrors {{
+            field
             message
         }}
     }}
     """
 
 
-def batch_update_hsn_codes(inventory_item_ids, hsn_codes):
-    total_updates = len(inventory_item_ids)
-    for i in range(0, total_updates, UPDATE_BATCH_SIZE):
-        mutations = []
-        batch_inventory_item_ids = inventory_item_ids[i : i + UPDATE_BATCH_SIZE]
-        batch_hsn_codes = hsn_codes[i : i + UPDATE_BATCH_SIZE]
+class UpdateBatchSize:
+    """
+    Number of aliased inventoryItemUpdate mutations to send per request,
+    tuned from the cost of each batch.
+
+    The size doubles while the bucket has room for a batch twice as large,
+    up to the number of mutations that fit under the single-query cost limit,
+    and halves whenever a request has been throttled since the last batch.
+    """
+
+    def __init__(self, size=UPDATE_BATCH_SIZE):
+        self.size = size
+        self._throttled = throttler.throttled
+
+    def update(self, count, cost):
+        """Adjust the size after a batch of ``count`` mutations cost ``cost``."""
+        requested = cost.get("requestedQueryCost")
+        if not requested:
+            return
+        actual = cost.get("actualQueryCost") or requested
+        limit = min(SINGLE_QUERY_COST_LIMIT, throttler.maximum_available)
+        ceiling = max(1, int(limit // (requested / count)))
+
+        if throttler.throttled > self._throttled:
+            self._throttled = throttler.throttled
+            self.size = max(1, self.size // 2)
+        elif throttler.available >= 2 * self.size * actual / count:
+            self.size *= 2
+        self.size = min(self.size, ceiling)
+
+
+def _mutation_errors(response, key):
+    result = (response.get("data") or {}).get(key)
+    if result is None:
+        errors = response.get("errors") or [{"message": "No result returned"}]
+        return "; ".join(error["message"] for error in errors)
+    return "; ".join(
+        (
+            f"{'.'.join(error['field'])}: {error['message']}"
+            if error["field"]
+            else error["message"]
+        )
+        for error in result["userErrors"]
+    )
+
+
+def batch_update_hsn_codes(inventory_item_ids, hsn_codes, batch_size=None):
+    """
+    Update HSN codes with aliased inventoryItemUpdate mutations, sending as
+    many per request as ``batch_size`` currently allows.
+
+    Args:
+        inventory_item_ids: Inventory item GIDs to update
+        hsn_codes: New HSN code for each inventory item
+        batch_size: UpdateBatchSize carried across calls (a fresh one if not
+            given)
+
+    Returns:
+        list: Error message for each item, empty if it was updated
+    """
+    batch_size = batch_size or UpdateBatchSize()
+    errors = []
+    i = 0
+    while i < len(inventory_item_ids):
+        batch_inventory_item_ids = inventory_item_ids[i : i + batch_size.size]
+        batch_hsn_codes = hsn_codes[i : i + batch_size.size]
+        i += len(batch_inventory_item_ids)
+
+        mutations = [
+            generate_hsn_mutation(inventory_item_id, hsn_code, idx)
+            for idx, (inventory_item_id, hsn_code) in enumerate(
+                zip(batch_inventory_item_ids, batch_hsn_codes)
+            )
+        ]
+        mutation_query = "mutation {\n" + "\n".join(mutations) + "\n}"
+        response = graphql_request(mutation_query)
+
+        errors.extend(
+            _mutation_errors(response, f"updateInventoryItem_{idx}")
+            for idx in range(len(mutations))
+        )
+        batch_size.update(
+            len(mutations), response.get("extensions", {}).get("cost", {})
+        )
+    return errors
+
+
+def bulk_update_hsn_codes(inventory_item_ids, hsn_codes):
+    """
+    Update HSN codes with a single bulkOperationRunMutation, uploading one
+    variables line per inventory item.
+
+    Returns:
+        list: Error message for each item, empty if it was updated
+    """
+    errors = ["No result returned"] * len(inventory_item_ids)
+    variables = (
+        {"id": inventory_item_id, "input": {"harmonizedSystemCode": hsn_code}}
+        for inventory_item_id, hsn_code in zip(inventory_item_ids, hsn_codes)
+    )
+    for result in iter_bulk_mutation_results(HSN_BULK_MUTATION, variables):
+        errors[result["__lineNumber"]] = _mutation_errors(result, "inventoryItemUpdate")
+    return errors
+
+
+def diff_hsn_codes(product_variants, sku_hsn_map):
+    """
+    Find the variants whose HSN code differs from the one in ``sku_hsn_map``.
 
-        for idx, (inventory_item_id, hsn_code) in enumerate(
-            zip(batch_inventory_item_ids, batch_hsn_codes)
+    Returns:
+        list: (sku, inventory_item_id, hsn_code) for each update to make
+    """
+    updates = []
+    for variant in product_variants:
+        sku = variant["sku"]
+        current_hsn_code = variant["inventoryItem"]["harmonizedSystemCode"]
+        if sku in sku_hsn_map and (
+            not current_hsn_code or current_hsn_code != sku_hsn_map[sku]
         ):
-            mutations.append(generate_hsn_mutation(inventory_item_id, hsn_code, idx))
+            updates.append((sku, variant["inventoryItem"]["id"], sku_hsn_map[sku]))
+    return updates
+
+
+def _record_results(results, updates, errors, mirror, hsn_cache=None):
+    """Write one results row per update; returns how many succeeded."""
+    updated_ids = []
+    updated_codes = []
+    for (sku, inventory_item_id, hsn_code), error in zip(updates, errors):
+        status = "error" if error else "updated"
+        results.writerow([sku, inventory_item_id, hsn_code, status, error])
+        if not error:
+            updated_ids.append(inventory_item_id)
+            updated_codes.append(hsn_code)
+    if mirror is not None:
+        mirror.set_hsn_codes(updated_ids, updated_codes)
+    if hsn_cache is not None:
+        hsn_cache.set_hsn_codes(updated_ids, updated_codes)
+    return len(updated_ids)
 
-        if mutations:
-            mutation_query = "mutation {\n" + "\n".join(mutations) + "\n}"
-            graphql_request(mutation_query)
 
+def read_sku_hsn_map(input_file: Path):
+    """Read the sku -> hsncode mapping from a CSV, CSV_CHUNK_SIZE rows at a time."""
+    import pandas as pd
 
-def process_inventory_items(input_file: Path, qry_batch_size: int):
+    sku_hsn_map = {}
+    for chunk in pd.read_csv(
+        input_file, dtype={"hsncode": "string"}, chunksize=CSV_CHUNK_SIZE
+    ):
+        sku_hsn_map.update(zip(chunk["sku"], chunk["hsncode"]))
+    return sku_hsn_map
+
+
+def use_sku_lookup(sku_count, qry_batch_size):
+    """
+    Whether looking the SKUs up directly takes fewer requests than scanning
+    the whole catalog.
+    """
+    lookups = math.ceil(sku_count / SKU_LOOKUP_BATCH_SIZE)
+    scan_pages = math.ceil(get_variant_count() / qry_batch_size)
+    return lookups < scan_pages
+
+
+def process_inventory_items(
+    input_file: Path,
+    qry_batch_size: int,
+    bulk=False,
+    mirror=None,
+    results_file: Path = Path("hsn_update_results.csv"),
+    bulk_mutation=False,
+    checkpoint_file: Path = None,
+    hsn_cache=None,
+):
+    """
+    Update the HSN codes of the variants whose SKUs are listed in
+    ``input_file`` and write a per-SKU results CSV.
+
+    With a ``checkpoint_file``, the cursor of every page whose updates have
+    been applied is saved to it, and a rerun with the same, unedited input
+    file resumes the catalog scan after that page, appending to the results
+    file. Only the paginated API scan needs this: the SKU lookup and mirror
+    paths are cheap to rerun, and already-updated variants are skipped by the
+    diff.
+
+    Codes written are also recorded in the catalog ``mirror`` and the
+    ``hsn_cache`` (hsn_cache.HsnCache) if given, so neither serves stale
+    codes afterwards.
+    """
     print("Processing inventory items and updating HSN codes...")
 
-    data = pd.read_csv(input_file, dtype={"hsncode": "string"})
-    sku_hsn_map = dict(zip(data["sku"], data["hsncode"]))
+    sku_hsn_map = read_sku_hsn_map(input_file)
+    checkpoint = (
+        Checkpoint(checkpoint_file, file_key(input_file)) if checkpoint_file else None
+    )
+    after = checkpoint.cursor if checkpoint else None
 
     total_processed = 0
-    has_next_page = True
-    end_cursor = None
-
-    while has_next_page:
-        query = generate_inventory_query(first=qry_batch_size, after=end_cursor)
-        response = graphql_request(query)
+    total_failed = 0
+    batch_size = UpdateBatchSize()
 
-        product_variants = response["data"]["productVariants"]["edges"]
-        page_info = response["data"]["productVariants"]["pageInfo"]
+    if mirror is None and use_sku_lookup(len(sku_hsn_map), qry_batch_size):
+        print(f"Looking up the {len(sku_hsn_map)} SKUs directly...")
+        pages = (
+            (page, None) for page in iter_sku_variant_pages(sku_hsn_map, qry_batch_size)
+        )
+    elif mirror is None and not bulk and not bulk_mutation:
+        if after:
+            print(f"Resuming the catalog scan after cursor {after}")
+        pages = iter_variant_cursor_pages(qry_batch_size, after=after)
+    else:
+        pages = (
+            (page, None)
+            for page in iter_variant_pages(qry_batch_size, bulk, mirror=mirror)
+        )
+    if mirror is None:
+        # Fetch the next page while this one's mutations are sent; both
+        # stages draw on the shared cost throttler, which paces them.
+        pages = read_ahead(pages)
 
-        inventory_item_ids = []
-        hsn_codes = []
+    append = after is not None and results_file.exists()
+    with open(results_file, "a" if append else "w", newline="") as f:
+        results = csv.writer(f)
+        if not append:
+            results.writerow(
+                ["sku", "inventory_item_id", "hsn_code", "status", "errors"]
+            )
 
-        for variant in product_variants:
-            sku = variant["node"]["sku"]
-            current_hsn_code = variant["node"]["inventoryItem"]["harmonizedSystemCode"]
-            if sku in sku_hsn_map and (
-                not current_hsn_code or current_hsn_code != sku_hsn_map[sku]
-            ):
-                inventory_item_id = variant["node"]["inventoryItem"]["id"]
-                hsn_code = sku_hsn_map[sku]
-                inventory_item_ids.append(inventory_item_id)
-                hsn_codes.append(hsn_code)
+        if bulk_mutation:
+            updates = [
+                update
+                for page, _ in pages
+                for update in diff_hsn_codes(page, sku_hsn_map)
+            ]
+            if updates:
+                print(
+                    f"Submitting {len(updates)} HSN code updates as a bulk mutation..."
+                )
+                errors = bulk_update_hsn_codes(
+                    [update[1] for update in updates], [update[2] for update in updates]
+                )
+                total_processed = _record_results(
+                    results, updates, errors, mirror, hsn_cache
+                )
+                total_failed = len(updates) - total_processed
+            print(f"Total processed: {total_processed}, failed: {total_failed}")
 
-        if inventory_item_ids:
-            batch_update_hsn_codes(inventory_item_ids, hsn_codes)
-            total_processed += len(inventory_item_ids)
+        else:
+            for product_variants, cursor in pages:
+                updates = diff_hsn_codes(product_variants, sku_hsn_map)
+                if updates:
+                    errors = batch_update_hsn_codes(
+                        [update[1] for update in updates],
+                        [update[2] for update in updates],
+                        batch_size,
+                    )
+                    processed = _record_results(
+                        results, updates, errors, mirror, hsn_cache
+                    )
+                    total_processed += processed
+                    total_failed += len(updates) - processed
+                f.flush()
+                if checkpoint and cursor:
+                    checkpoint.set_cursor(cursor)
 
-        print(f"Total processed so far: {total_processed}")
+                print(
+                    f"Total processed so far: {total_processed}, "
+                    f"failed: {total_failed}, update batch size: {batch_size.size}"
+                )
 
-        has_next_page = page_info["hasNextPage"]
-        end_cursor = page_info["endCursor"]
+    if checkpoint:
+        checkpoint.clear()
+    print(f"Update complete! Results saved to {results_file}")
 
-        time.sleep(2)
 
-    print("Update complete!")
+app = typer.Typer(help="Update HSN codes of inventory items from a CSV file")
 
 
-def main():
-    process_inventory_items()
+@app.command()
+def main(
+    input_file: Annotated[
+        Path, typer.Argument(help="CSV with sku and hsncode columns")
+    ],
+    qry_batch_size: Annotated[
+        int, typer.Option("--qry-batch-size", help="Variants fetched per page")
+    ] = QUERY_BATCH_SIZE,
+    bulk: Annotated[
+        bool, typer.Option("--bulk", help="Read the catalog with a bulk operation")
+    ] = False,
+    local: Annotated[
+        bool,
+        typer.Option(
+            "--local", help="Refresh the local catalog mirror and diff against it"
+        ),
+    ] = False,
+    results_file: Annotated[
+        Path, typer.Option("--results-file", help="CSV file for per-SKU results")
+    ] = Path("hsn_update_results.csv"),
+    bulk_mutation: Annotated[
+        bool,
+        typer.Option("--bulk-mutation", help="Apply all updates as one bulk mutation"),
+    ] = False,
+    checkpoint_file: Annotated[
+        Path,
+        typer.Option(
+            "--checkpoint", help="File recording progress, to resume interrupted runs"
+        ),
+    ] = Path("hsn_update_checkpoint.json"),
+):
+    """Update HSN codes for the SKUs listed in INPUT_FILE"""
+    mirror = refresh_catalog(bulk=bulk) if local else None
+    # Keep the HSN cache gen-invoice --hsn-cache reuses in step with Shopify
+    hsn_cache = HsnCache(path=default_cache_path())
+    try:
+        process_inventory_items(
+            input_file,
+            qry_batch_size,
+            bulk,
+            mirror,
+            results_file,
+            bulk_mutation,
+            checkpoint_file,
+            hsn_cache,
+        )
+    finally:
+        if len(hsn_cache):
+            hsn_cache.save()
 
 
 if __name__ == "__main__":
-    main()
+    app()
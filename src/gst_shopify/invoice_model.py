@@ -0,0 +1,171 @@
+from dataclasses import dataclass, field
+from decimal import ROUND_HALF_UP, Decimal
+from types import MappingProxyType
+
+ZERO = Decimal("0.00")
+ONE = Decimal("1.00")
+DEFAULT_HSN_CODE = "00000000"
+SHIPPING_HSN_CODE = "996811"
+
+TRAN_DTLS = MappingProxyType(
+    {
+        "TaxSch": "GST",
+        "SupTyp": "EXPWOP",
+        "IgstOnIntra": "N",
+        "RegRev": "N",
+        "EcmGstin": None,
+    }
+)
+
+
+def round_amount(value):
+    """Round an amount to paise."""
+    return value.quantize(ZERO, rounding=ROUND_HALF_UP)
+
+
+def json_amount(value):
+    """Value of an amount in the invoice JSON: an int when whole, else a float."""
+    value = round_amount(value)
+    if value == value.to_integral_value():
+        return int(value)
+    return float(value)
+
+
+def _item_template(zero):
+    # Key order is the order of the e-invoice schema; None marks the fields
+    # filled in per line.
+    return MappingProxyType(
+        {
+            "SlNo": None,
+            "PrdDesc": None,
+            "IsServc": None,
+            "HsnCd": None,
+            "Qty": None,
+            "FreeQty": zero,
+            "Unit": None,
+            "UnitPrice": None,
+            "TotAmt": None,
+            "Discount": None,
+            "PreTaxVal": None,
+            "AssAmt": None,
+            "GstRt": zero,
+            "IgstAmt": zero,
+            "CgstAmt": zero,
+            "SgstAmt": zero,
+            "CesRt": zero,
+            "CesAmt": zero,
+            "CesNonAdvlAmt": zero,
+            "StateCesRt": zero,
+            "StateCesAmt": zero,
+            "StateCesNonAdvlAmt": zero,
+            "OthChrg": zero,
+            "TotItemVal": None,
+        }
+    )
+
+
+def _value_template(zero):
+    return MappingProxyType(
+        {
+            "AssVal": None,
+            "CgstVal": zero,
+            "SgstVal": zero,
+            "IgstVal": zero,
+            "CesVal": zero,
+            "StCesVal": zero,
+            "Discount": None,
+            "OthChrg": zero,
+            "RndOffAmt": zero,
+            "TotInvVal": None,
+        }
+    )
+
+
+# Templates holding the zero (tax) fields, as Decimals and as JSON values
+ITEM_TEMPLATE = _item_template(ZERO)
+JSON_ITEM_TEMPLATE = _item_template(0)
+VALUE_TEMPLATE = _value_template(ZERO)
+JSON_VALUE_TEMPLATE = _value_template(0)
+
+
+@dataclass(slots=True)
+class InvoiceLine:
+    """One ItemList entry of an export (LUT) e-invoice, which carries no tax."""
+
+    sl_no: int
+    description: str
+    hsn_code: str
+    quantity: Decimal
+    unit_price: Decimal
+    amount: Decimal  # before discount
+    discount: Decimal
+    value: Decimal  # after discount
+    is_service: bool = False
+    unit: str = "NOS"
+
+    def to_dict(self, as_json=False):
+        """
+        Return the ItemList entry, with amounts as Decimals or, if
+        ``as_json``, as the numbers written to the invoice JSON.
+        """
+        line = (JSON_ITEM_TEMPLATE if as_json else ITEM_TEMPLATE).copy()
+        amount = json_amount if as_json else (lambda v: v)
+        line["SlNo"] = str(self.sl_no)
+        line["PrdDesc"] = self.description
+        line["IsServc"] = "Y" if self.is_service else "N"
+        line["HsnCd"] = self.hsn_code
+        line["Qty"] = amount(self.quantity)
+        line["Unit"] = self.unit
+        line["UnitPrice"] = amount(self.unit_price)
+        line["TotAmt"] = amount(self.amount)
+        line["Discount"] = amount(self.discount)
+        line["PreTaxVal"] = line["AssAmt"] = line["TotItemVal"] = amount(self.value)
+        return line
+
+
+@dataclass(slots=True)
+class Invoice:
+    """An export (LUT) e-invoice, as built by e_invoice_exp_lut.build_invoice."""
+
+    number: str
+    date: str
+    seller: dict
+    buyer_name: str
+    address1: str
+    address2: str
+    city: str
+    items: list = field(default_factory=list)
+    assessable_value: Decimal = ZERO
+    discount: Decimal = ZERO
+    total_value: Decimal = ZERO
+
+    def to_dict(self, as_json=False):
+        """
+        Return the e-invoice payload, with amounts as Decimals or, if
+        ``as_json``, as the numbers written to the invoice JSON.
+        """
+        values = (JSON_VALUE_TEMPLATE if as_json else VALUE_TEMPLATE).copy()
+        amount = json_amount if as_json else (lambda v: v)
+        values["AssVal"] = amount(self.assessable_value)
+        values["Discount"] = amount(self.discount)
+        values["TotInvVal"] = amount(self.total_value)
+        return {
+            "Version": "1.1",
+            "TranDtls": TRAN_DTLS.copy(),
+            "DocDtls": {"Typ": "INV", "No": self.number, "Dt": self.date},
+            "SellerDtls": self.seller,
+            "BuyerDtls": {
+                "Gstin": "URP",
+                "LglNm": self.buyer_name,
+                "Pos": "96",
+                "Addr1": self.address1,
+                "Addr2": self.address2,
+                "Loc": self.city,
+                "Pin": 999999,
+                "Stcd": "96",
+                "Ph": None,
+                "Em": None,
+            },
+            "ItemList": [item.to_dict(as_json) for item in self.items],
+            "ValDtls": values,
+        }
@@ -0,0 +1,53 @@
+import sqlite3
+
+from gst_shopify.config import get_cache_dir
+
+DB_NAME = "gst_shopify.sqlite"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS order_names (
+    name TEXT PRIMARY KEY,
+    order_id TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS orders (
+    order_id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    payload TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS orders_name ON orders (name);
+CREATE INDEX IF NOT EXISTS orders_created_at ON orders (created_at);
+CREATE TABLE IF NOT EXISTS variants (
+    variant_id TEXT PRIMARY KEY,
+    sku TEXT,
+    inventory_item_id TEXT,
+    hsn_code TEXT,
+    product_status TEXT,
+    updated_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS variants_sku ON variants (sku);
+CREATE INDEX IF NOT EXISTS variants_inventory_item_id ON variants (inventory_item_id);
+CREATE TABLE IF NOT EXISTS sync_state (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+def default_db_path():
+    return get_cache_dir() / DB_NAME
+
+
+def connect(path=None):
+    """
+    Open the local SQLite store (creating it and its tables if needed).
+
+    The store is a plain cache of Shopify data; deleting the file is always
+    safe and only costs API calls to rebuild it.
+    """
+    path = path or default_db_path()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.executescript(SCHEMA)
+    return conn
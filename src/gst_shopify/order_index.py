@@ -0,0 +1,37 @@
+from gst_shopify.local_store import connect
+
+SQLITE_MAX_VARIABLES = 900  # stay under SQLite's bound-parameter limit
+
+
+class OrderIndex:
+    """
+    Persistent mapping of order name (e.g. "#1001") to Shopify order ID.
+
+    An order's ID never changes once it has a name, so entries never expire.
+    """
+
+    def __init__(self, conn=None):
+        self.conn = conn or connect()
+
+    def get_many(self, order_names):
+        """Return the known name -> ID mappings for the given names."""
+        order_names = list(order_names)
+        found = {}
+        for i in range(0, len(order_names), SQLITE_MAX_VARIABLES):
+            batch = order_names[i : i + SQLITE_MAX_VARIABLES]
+            placeholders = ", ".join("?" * len(batch))
+            found.update(
+                self.conn.execute(
+                    f"SELECT name, order_id FROM order_names "
+                    f"WHERE name IN ({placeholders})",
+                    batch,
+                ).fetchall()
+            )
+        return found
+
+    def put_many(self, name_to_id):
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO order_names (name, order_id) VALUES (?, ?)",
+                name_to_id.items(),
+            )
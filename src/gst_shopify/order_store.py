@@ -0,0 +1,166 @@
+import json
+
+import typer
+from typing_extensions import Annotated
+
+from gst_shopify.local_store import connect
+from gst_shopify.order_index import SQLITE_MAX_VARIABLES, OrderIndex
+from gst_shopify.orders import COMPLETE_ORDER_FIELDS, iter_order_pages
+
+WATERMARK_KEY = "orders_updated_at"
+
+
+class OrderStore:
+    """
+    Local copy of complete order payloads (orders.COMPLETE_ORDER_FIELDS with
+    HSN codes), kept current by sync_orders.
+
+    The e-invoice and Tally generators can run entirely off the store, so
+    reprocessing a period costs no API calls.
+    """
+
+    def __init__(self, conn=None):
+        self.conn = conn or connect()
+        self.index = OrderIndex(self.conn)
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM orders").fetchone()[0]
+
+    @property
+    def watermark(self):
+        row = self.conn.execute(
+            "SELECT value FROM sync_state WHERE key = ?", (WATERMARK_KEY,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def save_page(self, orders):
+        """Upsert one page of orders and advance the watermark atomically."""
+        if not orders:
+            return
+        watermark = max(order["updatedAt"] for order in orders)
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO orders "
+                "(order_id, name, created_at, updated_at, payload) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (
+                    (
+                        order["id"].split("/")[-1],
+                        order["name"],
+                        order["createdAt"],
+                        order["updatedAt"],
+                        json.dumps(order),
+                    )
+                    for order in orders
+                ),
+            )
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO order_names (name, order_id) VALUES (?, ?)",
+                ((order["name"], order["id"].split("/")[-1]) for order in orders),
+            )
+            if self.watermark is None or watermark > self.watermark:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO sync_state (key, value) VALUES (?, ?)",
+                    (WATERMARK_KEY, watermark),
+                )
+
+    def get_many(self, order_ids):
+        """Return the stored payloads for the given order IDs."""
+        order_ids = list(order_ids)
+        found = {}
+        for i in range(0, len(order_ids), SQLITE_MAX_VARIABLES):
+            batch = order_ids[i : i + SQLITE_MAX_VARIABLES]
+            placeholders = ", ".join("?" * len(batch))
+            for order_id, payload in self.conn.execute(
+                f"SELECT order_id, payload FROM orders "
+                f"WHERE order_id IN ({placeholders})",
+                batch,
+            ):
+                found[order_id] = json.loads(payload)
+        return found
+
+    def get_order_ids(self, order_names):
+        """
+        Local counterpart of orders.get_order_ids_from_names: return the
+        name -> ID mappings of the stored orders, in input order, leaving out
+        names that are not in the store.
+        """
+        found = self.index.get_many(order_names)
+        return {name: found[name] for name in order_names if name in found}
+
+    def iter_created_between(self, start, end):
+        """
+        Yield the stored payloads of orders created from ``start`` up to (but
+        not including) ``end``, ISO date or timestamp strings, oldest first.
+        """
+        for (payload,) in self.conn.execute(
+            "SELECT payload FROM orders WHERE created_at >= ? AND created_at < ? "
+            "ORDER BY created_at",
+            (start, end),
+        ):
+            yield json.loads(payload)
+
+    def iter_orders_details(self, order_ids):
+        """
+        Local counterpart of orders.iter_orders_details.
+
+        Yields:
+            tuple: (order_id, order, error) in input order
+        """
+        order_ids = list(order_ids)
+        for i in range(0, len(order_ids), SQLITE_MAX_VARIABLES):
+            batch = order_ids[i : i + SQLITE_MAX_VARIABLES]
+            found = self.get_many(batch)
+            for order_id in batch:
+                if order_id in found:
+                    yield order_id, found[order_id], None
+                else:
+                    yield order_id, None, ValueError(
+                        f"Order {order_id} is not in the local store; run sync-orders"
+                    )
+
+
+def sync_orders(store=None, full=False):
+    """
+    Pull every order updated since the stored watermark into the local store.
+
+    Args:
+        store: OrderStore to sync (the default local store if not given)
+        full: Ignore the watermark and fetch all orders
+
+    Returns:
+        int: Number of orders fetched
+    """
+    if store is None:
+        store = OrderStore()
+    watermark = None if full else store.watermark
+    # >= rather than >, so orders sharing the watermark's second aren't missed;
+    # re-fetching them is harmless since pages are upserted.
+    search = f"updated_at:>='{watermark}'" if watermark else ""
+    print(f"Syncing orders updated since {watermark or 'the beginning'}...")
+
+    total = 0
+    for page in iter_order_pages(search, "UPDATED_AT", True, COMPLETE_ORDER_FIELDS):
+        store.save_page(page)
+        total += len(page)
+        print(f"Synced {total} orders, watermark: {store.watermark}")
+
+    print(f"Sync complete: {total} orders fetched, {len(store)} in the local store")
+    return total
+
+
+app = typer.Typer(help="Sync Shopify orders into the local order store")
+
+
+@app.command()
+def main(
+    full: Annotated[
+        bool, typer.Option("--full", help="Ignore the watermark and refetch all")
+    ] = False,
+):
+    """Fetch orders updated since the last sync into the local order store"""
+    sync_orders(full=full)
+
+
+if __name__ == "__main__":
+    app()
@@ -1,131 +1,171 @@
-from gst_shopify.api_client import graphql_request
+import asyncio
+
+from gst_shopify.api_client import (
+    async_graphql_request,
+    graphql_request,
+    make_semaphore,
+    throttler,
+)
+from gst_shopify.hsn_cache import fill_orders_hsn_codes
+from gst_shopify.pipeline import prefetch
+from gst_shopify.throttle import SINGLE_QUERY_COST_LIMIT
 
 QUERY_BATCH_SIZE = 250
+NODES_BATCH_SIZE = 250  # nodes(ids:) accepts at most 250 IDs
+
+# requestedQueryCost of one order's field set, learned from the first request
+_order_query_costs = {}
 
 
-def get_order_ids_from_names(order_names, batch_size=QUERY_BATCH_SIZE):
+def _order_names_query(batch, batch_size):
+    query_str = " OR ".join(f"name:{name}" for name in batch)
+    return f"""
+    {{
+        orders(first: {batch_size}, query: "{query_str}") {{
+            edges {{
+                node {{
+                    id
+                    name
+                }}
+            }}
+        }}
+    }}
     """
-    Look up multiple Shopify order IDs using order names in batches.
+
+
+def _collect_order_ids(response):
+    try:
+        return {
+            order["node"]["name"]: order["node"]["id"].split("/")[-1]
+            for order in response["data"]["orders"]["edges"]
+        }
+    except (KeyError, IndexError, TypeError) as e:
+        raise ValueError(f"Error processing orders response: {e}")
+
+
+async def async_get_order_ids_from_names(
+    order_names,
+    batch_size=QUERY_BATCH_SIZE,
+    concurrency=None,
+    index=None,
+    allow_missing=False,
+):
+    """
+    Look up multiple Shopify order IDs using order names, resolving the
+    batches concurrently.
 
     Args:
         order_names: List of order names (e.g., ["#1001", "#1002"])
         batch_size: Number of orders to query in each batch
+        concurrency: Maximum number of batch queries in flight
+        index: Optional order_index.OrderIndex checked first; only names
+            missing from it are looked up, and the results are written back
+        allow_missing: Leave names that are not found out of the result
+            instead of raising ValueError
 
     Returns:
         dict: Mapping of order names to their IDs
     """
-    name_to_id = {}
-    orders_not_found = set(order_names)
-
-    for i in range(0, len(order_names), batch_size):
-        batch = order_names[i : i + batch_size]
-        query_str = " OR ".join(f"name:{name}" for name in batch)
-
-        query = f"""
-        {{
-            orders(first: {batch_size}, query: "{query_str}") {{
-                edges {{
-                    node {{
-                        id
-                        name
-                    }}
-                }}
-            }}
-        }}
-        """
-        response = graphql_request(query)
-        try:
-            orders = response["data"]["orders"]["edges"]
-            for order in orders:
-                name = order["node"]["name"]
-                order_id = order["node"]["id"].split("/")[-1]
-                name_to_id[name] = order_id
-                orders_not_found.discard(name)  # Remove from not found set
-        except (KeyError, IndexError) as e:
-            raise ValueError(f"Error processing orders response: {e}")
-
-    if orders_not_found:
+    name_to_id = index.get_many(order_names) if index is not None else {}
+    misses = [name for name in order_names if name not in name_to_id]
+    if index is not None:
+        print(f"{len(name_to_id)} order IDs found in the local index")
+
+    semaphore = make_semaphore(concurrency)
+    responses = await asyncio.gather(
+        *(
+            async_graphql_request(
+                _order_names_query(misses[i : i + batch_size], batch_size),
+                semaphore=semaphore,
+            )
+            for i in range(0, len(misses), batch_size)
+        )
+    )
+
+    resolved = {}
+    for response in responses:
+        resolved.update(_collect_order_ids(response))
+    if index is not None and resolved:
+        index.put_many(resolved)
+    name_to_id.update(resolved)
+
+    orders_not_found = set(order_names) - name_to_id.keys()
+    if orders_not_found and not allow_missing:
         raise ValueError(f"Orders not found: {', '.join(orders_not_found)}")
 
     return name_to_id
 
 
-def get_complete_order_details(order_id):
+def get_order_ids_from_names(
+    order_names, batch_size=QUERY_BATCH_SIZE, index=None, allow_missing=False
+):
     """
-    Fetch comprehensive order details including all fields needed for both
-    Tally exports and e-invoice generation
+    Look up multiple Shopify order IDs using order names in batches.
 
     Args:
-        order_id: The Shopify order ID (numeric part only)
+        order_names: List of order names (e.g., ["#1001", "#1002"])
+        batch_size: Number of orders to query in each batch
+        index: Optional order_index.OrderIndex checked before querying Shopify
+        allow_missing: Leave names that are not found out of the result
+            instead of raising ValueError
 
     Returns:
-        dict: Complete order information
+        dict: Mapping of order names to their IDs
     """
-    query = """
-    {
-      order(id: "gid://shopify/Order/ORDER_ID") {
+    return asyncio.run(
+        async_get_order_ids_from_names(
+            order_names, batch_size, index=index, allow_missing=allow_missing
+        )
+    )
+
+
+MONEY = "shopMoney { amount currencyCode }"
+ADDRESS_FIELDS = (
+    "address1 address2 city province provinceCode zip country countryCode phone"
+)
+
+# Composable GraphQL fragments on Order. Each consumer declares the fragments
+# it needs, and only those are sent, so it pays only for its own fields.
+# Fragments that select the same connection (e.g. lineItems) are merged by
+# GraphQL, so they can be combined freely.
+ORDER_FRAGMENTS = {
+    "OrderCore": """
         id
         name
         createdAt
+        updatedAt
         processedAt
         cancelledAt
-        
-        # Financial details
-        totalPriceSet { shopMoney { amount currencyCode } }
-        subtotalPriceSet { shopMoney { amount currencyCode } }
-        totalTaxSet { shopMoney { amount currencyCode } }
-        totalShippingPriceSet { shopMoney { amount currencyCode } }
-        totalDiscountsSet { shopMoney { amount currencyCode } }
-        
-        # Customer details
+    """,
+    "OrderTotals": f"""
+        totalPriceSet {{ {MONEY} }}
+        subtotalPriceSet {{ {MONEY} }}
+        totalTaxSet {{ {MONEY} }}
+        totalShippingPriceSet {{ {MONEY} }}
+        totalDiscountsSet {{ {MONEY} }}
+    """,
+    "OrderCustomerName": """
         customer {
           firstName
           lastName
-          email
-          phone
-          defaultAddress {
-            address1
-            address2
-            city
-            province
-            provinceCode
-            zip
-            country
-            countryCode
-            phone
-          }
         }
-        
-        # Address details
-        shippingAddress {
-          address1
-          address2
-          city
-          province
-          provinceCode
-          zip
-          country
-          countryCode
-          phone
-          name
-          company
-        }
-        
-        billingAddress {
-          address1
-          address2
-          city
-          province
-          provinceCode
-          zip
-          country
-          countryCode
+    """,
+    "OrderCustomer": f"""
+        customer {{
+          firstName
+          lastName
+          email
           phone
-          name
-          company
-        }
-        
-        # Tax information
+          defaultAddress {{ {ADDRESS_FIELDS} }}
+        }}
+    """,
+    "OrderShippingAddress": f"""
+        shippingAddress {{ {ADDRESS_FIELDS} name company }}
+    """,
+    "OrderBillingAddress": f"""
+        billingAddress {{ {ADDRESS_FIELDS} name company }}
+    """,
+    "OrderTaxes": """
         taxExempt
         taxesIncluded
         taxLines {
@@ -133,8 +173,25 @@ def get_complete_order_details(order_id):
           rate
           priceSet { shopMoney { amount } }
         }
-        
-        # Line items with details
+    """,
+    # Just what an e-invoice line needs
+    "OrderLineItemSummary": """
+        lineItems(first: 50) {
+          edges {
+            node {
+              id
+              name
+              title
+              quantity
+              fulfillmentStatus
+              variant { id }
+              originalUnitPriceSet { shopMoney { amount } }
+              totalDiscountSet { shopMoney { amount } }
+            }
+          }
+        }
+    """,
+    "OrderLineItemDetails": """
         lineItems(first: 50) {
           edges {
             node {
@@ -148,22 +205,16 @@ def get_complete_order_details(order_id):
               vendor
               title
               variantTitle
-              
               variant {
                 id
                 price
                 sku
                 title
-                inventoryItem {
-                  harmonizedSystemCode
-                  tracked
-                }
               }
-              
+              originalUnitPriceSet { shopMoney { amount } }
               discountedTotalSet { shopMoney { amount } }
               originalTotalSet { shopMoney { amount } }
               totalDiscountSet { shopMoney { amount } }
-              
               taxLines {
                 title
                 rate
@@ -172,8 +223,31 @@ def get_complete_order_details(order_id):
             }
           }
         }
-        
-        # Fulfillment information
+    """,
+    # Per-line-item inventory data; skipped when HSN codes come from a cache,
+    # as it is multiplied by the lineItems page size in the query cost.
+    "OrderLineItemHsn": """
+        lineItems(first: 50) {
+          edges {
+            node {
+              variant {
+                id
+                inventoryItem {
+                  id
+                  harmonizedSystemCode
+                  tracked
+                }
+              }
+            }
+          }
+        }
+    """,
+    "OrderFulfillmentDates": """
+        fulfillments(first: 10) {
+          createdAt
+        }
+    """,
+    "OrderFulfillments": """
         fulfillments(first: 10) {
           id
           status
@@ -184,24 +258,270 @@ def get_complete_order_details(order_id):
             company
           }
         }
-        
-        # Payment information
-        transactions(first: 10) {
+    """,
+    "OrderTransactions": f"""
+        transactions(first: 10) {{
           id
           gateway
           kind
           status
           processedAt
-          amountSet { shopMoney { amount currencyCode } }
+          amountSet {{ {MONEY} }}
           paymentId
-        }
-      }
-    }
-    """.replace("ORDER_ID", order_id)
+        }}
+    """,
+}
+
+# Everything needed by both Tally exports and e-invoice generation
+COMPLETE_ORDER_FIELDS = (
+    "OrderCore",
+    "OrderTotals",
+    "OrderCustomer",
+    "OrderShippingAddress",
+    "OrderBillingAddress",
+    "OrderTaxes",
+    "OrderLineItemDetails",
+    "OrderFulfillments",
+    "OrderTransactions",
+)
+E_INVOICE_ORDER_FIELDS = (
+    "OrderCore",
+    "OrderTotals",
+    "OrderCustomerName",
+    "OrderShippingAddress",
+    "OrderLineItemSummary",
+    "OrderFulfillmentDates",
+)
+TALLY_ORDER_FIELDS = (
+    "OrderCore",
+    "OrderTotals",
+    "OrderCustomerName",
+    "OrderShippingAddress",
+    "OrderTaxes",
+    "OrderLineItemDetails",
+    "OrderTransactions",
+)
+
 
-    response = graphql_request(query)
+def _fragments(fields, include_hsn=True):
+    if include_hsn:
+        fields = (*fields, "OrderLineItemHsn")
+    spreads = " ".join(f"...{name}" for name in fields)
+    definitions = "".join(f"""
+    fragment {name} on Order {{{ORDER_FRAGMENTS[name]}}}
+    """ for name in fields)
+    return spreads, definitions
 
+
+def _order_details_query(order_id, include_hsn=True, fields=COMPLETE_ORDER_FIELDS):
+    spreads, definitions = _fragments(fields, include_hsn)
+    return f"""
+    {{
+      order(id: "gid://shopify/Order/{order_id}") {{ {spreads} }}
+    }}
+    {definitions}"""
+
+
+def _orders_nodes_query(order_ids, include_hsn=True, fields=COMPLETE_ORDER_FIELDS):
+    spreads, definitions = _fragments(fields, include_hsn)
+    ids = ", ".join(f'"gid://shopify/Order/{order_id}"' for order_id in order_ids)
+    return f"""
+    {{
+      nodes(ids: [{ids}]) {{
+        ... on Order {{ {spreads} }}
+      }}
+    }}
+    {definitions}"""
+
+
+def _extract_order(response, order_id):
     if not response.get("data") or not response["data"].get("order"):
         raise ValueError(f"Order {order_id} not found")
 
-    return response["data"]["order"]
\ No newline at end of file
+    return response["data"]["order"]
+
+
+def get_complete_order_details(
+    order_id, include_hsn=True, fields=COMPLETE_ORDER_FIELDS
+):
+    """
+    Fetch comprehensive order details including all fields needed for both
+    Tally exports and e-invoice generation
+
+    Args:
+        order_id: The Shopify order ID (numeric part only)
+        include_hsn: Fetch each line item's inventoryItem; pass False when
+            HSN codes come from an hsn_cache.HsnCache instead
+        fields: Names of ORDER_FRAGMENTS to request; consumers that need less
+            pass E_INVOICE_ORDER_FIELDS or TALLY_ORDER_FIELDS
+
+    Returns:
+        dict: Complete order information
+    """
+    response = graphql_request(_order_details_query(order_id, include_hsn, fields))
+    return _extract_order(response, order_id)
+
+
+async def async_get_complete_order_details(
+    order_id, semaphore=None, include_hsn=True, fields=COMPLETE_ORDER_FIELDS
+):
+    """
+    Async counterpart of get_complete_order_details; pass a shared semaphore
+    to bound how many order queries are in flight.
+    """
+    response = await async_graphql_request(
+        _order_details_query(order_id, include_hsn, fields), semaphore=semaphore
+    )
+    return _extract_order(response, order_id)
+
+
+def _orders_page_query(search, first, after, sort_key, include_hsn, fields):
+    spreads, definitions = _fragments(fields, include_hsn)
+    after_str = f', after: "{after}"' if after else ""
+    return f"""
+    {{
+      orders(first: {first}{after_str}, sortKey: {sort_key}, query: "{search}") {{
+        edges {{
+          node {{ {spreads} }}
+        }}
+        pageInfo {{
+          hasNextPage
+          endCursor
+        }}
+      }}
+    }}
+    {definitions}"""
+
+
+def order_query_cost(include_hsn=True, fields=COMPLETE_ORDER_FIELDS):
+    """Per-order requestedQueryCost of a field set, once it has been observed."""
+    return _order_query_costs.get((fields, include_hsn))
+
+
+def get_orders_details(order_ids, include_hsn=True, fields=COMPLETE_ORDER_FIELDS):
+    """
+    Fetch several orders in one nodes(ids:) request, using the same field set
+    as get_complete_order_details.
+
+    Returns:
+        dict: Mapping of order ID to order payload; orders that were not found
+        are left out
+    """
+    response = graphql_request(_orders_nodes_query(order_ids, include_hsn, fields))
+    if not response.get("data"):
+        raise ValueError(f"Orders {', '.join(order_ids)} could not be fetched")
+
+    cost = response.get("extensions", {}).get("cost", {})
+    if "requestedQueryCost" in cost:
+        _order_query_costs[(fields, include_hsn)] = cost["requestedQueryCost"] / len(
+            order_ids
+        )
+
+    return {
+        node["id"].split("/")[-1]: node for node in response["data"]["nodes"] if node
+    }
+
+
+def order_chunk_size(include_hsn=True, fields=COMPLETE_ORDER_FIELDS):
+    """
+    Number of orders that fit in one nodes(ids:) query without exceeding the
+    single-query cost limit (or the bucket size, if that is smaller).
+    """
+    cost_per_order = order_query_cost(include_hsn, fields)
+    if not cost_per_order:
+        return 1
+    limit = min(SINGLE_QUERY_COST_LIMIT, throttler.maximum_available)
+    return max(1, min(NODES_BATCH_SIZE, int(limit // cost_per_order)))
+
+
+def iter_orders_details(
+    order_ids,
+    include_hsn=True,
+    workers=1,
+    fields=COMPLETE_ORDER_FIELDS,
+    hsn_cache=None,
+):
+    """
+    Fetch many orders with cost-budgeted nodes(ids:) chunks.
+
+    The first chunk holds a single order so that the per-order query cost can
+    be learned (and is reported); the remaining IDs are split into chunks
+    sized from it and fetched by up to ``workers`` threads. If an
+    hsn_cache.HsnCache is given, the HSN codes of each chunk are filled in
+    from it, fetching the variants it misses together.
+
+    Yields:
+        tuple: (order_id, order, error) in input order, where error is set
+        (and order is None) if the order could not be fetched
+    """
+    order_ids = list(order_ids)
+
+    def fetch_chunk(chunk):
+        orders = get_orders_details(chunk, include_hsn, fields)
+        if hsn_cache is not None:
+            fill_orders_hsn_codes(orders.values(), hsn_cache)
+        return orders
+
+    def chunk_results(chunk, orders, error):
+        for order_id in chunk:
+            if error is not None:
+                yield order_id, None, error
+            elif order_id in orders:
+                yield order_id, orders[order_id], None
+            else:
+                yield order_id, None, ValueError(f"Order {order_id} not found")
+
+    start = 0
+    if order_chunk_size(include_hsn, fields) == 1 and order_ids:
+        first = order_ids[:1]
+        orders, error = None, None
+        try:
+            orders = fetch_chunk(first)
+        except Exception as e:
+            error = e
+        yield from chunk_results(first, orders, error)
+        start = 1
+
+    size = order_chunk_size(include_hsn, fields)
+    cost = order_query_cost(include_hsn, fields)
+    if cost:
+        print(f"Order query cost: {cost:g} points per order, {size} orders per request")
+    chunks = (order_ids[i : i + size] for i in range(start, len(order_ids), size))
+    for chunk, orders, error in prefetch(fetch_chunk, chunks, workers):
+        yield from chunk_results(chunk, orders, error)
+
+
+def iter_order_pages(
+    search="", sort_key="UPDATED_AT", include_hsn=True, fields=COMPLETE_ORDER_FIELDS
+):
+    """
+    Page through all orders matching a search query (e.g.
+    "updated_at:>='2024-04-01T00:00:00Z'"), sizing each page from the field
+    set's observed query cost so that every request stays under the
+    single-query cost limit.
+
+    Yields:
+        list: Order payloads of one page
+    """
+    has_next_page = True
+    end_cursor = None
+    while has_next_page:
+        first = order_chunk_size(include_hsn, fields)
+        query = _orders_page_query(
+            search, first, end_cursor, sort_key, include_hsn, fields
+        )
+        response = graphql_request(query)
+        if not response.get("data"):
+            raise ValueError(f"Orders matching '{search}' could not be fetched")
+
+        cost = response.get("extensions", {}).get("cost", {})
+        if "requestedQueryCost" in cost:
+            _order_query_costs[(fields, include_hsn)] = (
+                cost["requestedQueryCost"] / first
+            )
+
+        orders = response["data"]["orders"]
+        yield [edge["node"] for edge in orders["edges"]]
+
+        has_next_page = orders["pageInfo"]["hasNextPage"]
+        end_cursor = orders["pageInfo"]["endCursor"]
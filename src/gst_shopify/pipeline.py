@@ -0,0 +1,157 @@
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+WRITER_QUEUE_SIZE = 64
+READ_AHEAD_SIZE = 2
+PROCESS_CHUNK_SIZE = 50  # items pickled per work unit sent to a worker process
+_DONE = object()
+
+
+def prefetch(func, items, workers):
+    """
+    Apply ``func`` to each item on a pool of ``workers`` threads.
+
+    Results are yielded in input order as ``(item, result, error)`` tuples,
+    with at most ``2 * workers`` calls started ahead of the consumer, so
+    memory stays bounded however many items there are.
+    """
+    items = iter(items)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+
+        def submit_next():
+            for item in items:
+                pending.append((item, executor.submit(func, item)))
+                return
+
+        for _ in range(2 * workers):
+            submit_next()
+        while pending:
+            item, future = pending.popleft()
+            submit_next()
+            try:
+                yield item, future.result(), None
+            except Exception as e:
+                yield item, None, e
+
+
+def process_chunks(
+    func, items, processes, chunk_size=PROCESS_CHUNK_SIZE, initializer=None, initargs=()
+):
+    """
+    Apply ``func`` to lists of up to ``chunk_size`` items on a pool of
+    ``processes`` worker processes, for CPU-bound work the GIL would
+    otherwise serialize.
+
+    ``func`` must be a module-level function taking a list of items; its
+    results are yielded in input order, with at most ``2 * processes`` chunks
+    in flight so memory stays bounded. Sending chunks rather than single
+    items keeps the pickling overhead per item small. Workers are spawned
+    rather than forked, as the calling process usually runs other threads.
+    """
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    items = iter(items)
+    with ProcessPoolExecutor(
+        max_workers=processes,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=initializer,
+        initargs=initargs,
+    ) as executor:
+        pending = deque()
+
+        def submit_next():
+            if chunk := list(islice(items, chunk_size)):
+                pending.append(executor.submit(func, chunk))
+
+        for _ in range(2 * processes):
+            submit_next()
+        while pending:
+            future = pending.popleft()
+            submit_next()
+            yield future.result()
+
+
+def read_ahead(items, maxsize=READ_AHEAD_SIZE):
+    """
+    Iterate over ``items`` on a background thread, keeping up to ``maxsize``
+    of them queued ahead of the consumer.
+
+    Lets a paginated read overlap with the processing of the previous page;
+    the producer blocks once the queue is full. Exceptions raised while
+    producing are re-raised in the consumer.
+    """
+    buffer = queue.Queue(maxsize=maxsize)
+    stopped = threading.Event()
+
+    def put(entry):
+        while not stopped.is_set():
+            try:
+                buffer.put(entry, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in items:
+                if not put((item, None)):
+                    return
+        except Exception as e:
+            put((_DONE, e))
+        else:
+            put((_DONE, None))
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while (entry := buffer.get())[0] is not _DONE:
+            yield entry[0]
+        if entry[1] is not None:
+            raise entry[1]
+    finally:
+        stopped.set()
+
+
+class OrderedWriter:
+    """
+    Run output jobs (file writes and console messages) on one background
+    thread, in the order they were submitted.
+
+    Routing all output through the writer keeps the console deterministic
+    while the producer moves on to the next item.
+    """
+
+    def __init__(self, maxsize=WRITER_QUEUE_SIZE):
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while (job := self._queue.get()) is not None:
+            func, args = job
+            try:
+                func(*args)
+            except Exception as e:
+                print(f"Output error: {e}")
+
+    def submit(self, func, *args):
+        self._queue.put((func, args))
+
+    def print(self, message):
+        self.submit(print, message)
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -1,9 +1,50 @@
-import jinja2
-from datetime import datetime
-from decimal import Decimal
+import os
+from datetime import datetime, timedelta
 from pathlib import Path
+from typing import Optional
 
-from gst_shopify.orders import get_complete_order_details, get_order_ids_from_names
+import typer
+from typing_extensions import Annotated
+
+from gst_shopify.hsn_cache import (
+    fill_hsn_codes,
+    fill_orders_hsn_codes,
+    should_fetch_hsn,
+)
+from gst_shopify.order_index import OrderIndex
+from gst_shopify.order_store import OrderStore
+from gst_shopify.orders import (
+    TALLY_ORDER_FIELDS,
+    get_complete_order_details,
+    get_order_ids_from_names,
+    iter_order_pages,
+    iter_orders_details,
+)
+from gst_shopify.pipeline import process_chunks
+
+TEMPLATE_DIR = Path(__file__).parent / "templates"
+
+_jinja_env = None
+
+
+def get_template(name):
+    """
+    Return a compiled template from TEMPLATE_DIR.
+
+    One Environment is shared by every call, so each template is loaded and
+    compiled once per process and then served from Jinja's template cache.
+    """
+    global _jinja_env
+    if _jinja_env is None:
+        import jinja2
+
+        env = jinja2.Environment(
+            loader=jinja2.FileSystemLoader(TEMPLATE_DIR),
+            autoescape=jinja2.select_autoescape(["xml", "xml.j2"]),
+        )
+        env.filters["format_date"] = format_tally_date
+        _jinja_env = env
+    return _jinja_env.get_template(name)
 
 
 def format_tally_date(date_str):
@@ -14,17 +55,21 @@ def format_tally_date(date_str):
     return date_str.strftime("%Y%m%d")
 
 
+def get_customer_name(order):
+    """Return the customer's full name, or "Guest Customer" if there is none"""
+    customer = order.get("customer") or {}
+    first_name = customer.get("firstName") or ""
+    last_name = customer.get("lastName") or ""
+    return f"{first_name} {last_name}".strip() or "Guest Customer"
+
+
 def prepare_sales_data(order):
     """Transform GraphQL order data into format needed for sales XML template"""
-    # Extract customer name
-    first_name = order.get("customer", {}).get("firstName", "")
-    last_name = order.get("customer", {}).get("lastName", "")
-    customer_name = f"{first_name} {last_name}".strip()
-    if not customer_name:
-        customer_name = "Guest Customer"
+    # Extract customer name (customer is null for guest or redacted customers)
+    customer_name = get_customer_name(order)
 
     # Extract shipping address
-    shipping = order.get("shippingAddress", {})
+    shipping = order.get("shippingAddress") or {}
     address_parts = []
     if shipping.get("address1"):
         address_parts.append(shipping["address1"])
@@ -72,15 +117,14 @@ def prepare_sales_data(order):
     line_items = []
     for edge in order.get("lineItems", {}).get("edges", []):
         node = edge["node"]
-        variant = node.get("variant", {})
+        variant = node.get("variant") or {}  # null for deleted products
 
         item = {
             "name": node["name"],
             "quantity": float(node["quantity"]),
             "price": float(variant.get("price", "0")),
-            "hsn_code": variant.get("inventoryItem", {}).get(
-                "harmonizedSystemCode", "00000000"
-            ),
+            "hsn_code": (variant.get("inventoryItem") or {}).get("harmonizedSystemCode")
+            or "00000000",
             "total": float(
                 node.get("discountedTotalSet", {})
                 .get("shopMoney", {})
@@ -120,11 +164,7 @@ def prepare_sales_data(order):
 def prepare_payment_data(order, transaction):
     """Transform GraphQL transaction data into format needed for payment XML template"""
     # Extract customer name from order
-    first_name = order.get("customer", {}).get("firstName", "")
-    last_name = order.get("customer", {}).get("lastName", "")
-    customer_name = f"{first_name} {last_name}".strip()
-    if not customer_name:
-        customer_name = "Guest Customer"
+    customer_name = get_customer_name(order)
 
     # Extract payment details
     payment_id = transaction["id"].split("/")[-1]  # Extract numeric ID
@@ -146,7 +186,8 @@ def prepare_payment_data(order, transaction):
         "company_name": "Your Company Name",  # Replace with actual company name from config
         "payment_date": transaction["processedAt"],
         "payment_id": payment_id,
-        "gateway_ref": transaction.get("paymentId", ""),  # Using paymentId instead of authorization
+        # Using paymentId instead of authorization
+        "gateway_ref": transaction.get("paymentId", ""),
         "customer_name": customer_name,
         "order_name": order["name"].replace("#", ""),
         "payment_amount": payment_amount,
@@ -155,13 +196,15 @@ def prepare_payment_data(order, transaction):
     }
 
 
-def generate_tally_xml(order_id, output_dir=Path("tally_imports")):
+def write_tally_xml(order, output_dir=Path("tally_imports"), company_name=None):
     """
-    Generate Tally XML import files for an order and its payments
+    Write Tally XML import files for an already fetched order and its payments
 
     Args:
-        order_id: Shopify order ID
+        order: Order payload with the orders.TALLY_ORDER_FIELDS field set
         output_dir: Directory to save XML files
+        company_name: Tally company to import into (the one open in Tally if
+            not given)
 
     Returns:
         dict: Paths to generated files
@@ -169,26 +212,15 @@ def generate_tally_xml(order_id, output_dir=Path("tally_imports")):
     # Ensure output directory exists
     output_dir.mkdir(parents=True, exist_ok=True)
 
-    # Create Jinja environment
-    template_dir = Path(__file__).parent / "templates"
-    env = jinja2.Environment(
-        loader=jinja2.FileSystemLoader(template_dir),
-        autoescape=jinja2.select_autoescape(["xml"]),
-    )
-    env.filters["format_date"] = format_tally_date
-
     # Load templates
-    sales_template = env.get_template("sales_voucher.xml.j2")
-    payment_template = env.get_template("payment_voucher.xml.j2")
-
-    # Get order details with GraphQL
-    order = get_complete_order_details(order_id)
+    sales_template = get_template("sales_voucher.xml.j2")
+    payment_template = get_template("payment_voucher.xml.j2")
 
     # Prepare data for sales voucher
     sales_data = prepare_sales_data(order)
 
     # Generate sales voucher XML
-    sales_xml = sales_template.render(**sales_data)
+    sales_xml = sales_template.render(voucher=sales_data, company_name=company_name)
     sales_file = output_dir / f"sales_{order['name'].replace('#', '')}.xml"
     with open(sales_file, "w", encoding="utf-8") as f:
         f.write(sales_xml)
@@ -201,7 +233,9 @@ def generate_tally_xml(order_id, output_dir=Path("tally_imports")):
         if transaction.get("kind") == "SALE" and transaction.get("status") == "SUCCESS":
             payment_data = prepare_payment_data(order, transaction)
 
-            payment_xml = payment_template.render(**payment_data)
+            payment_xml = payment_template.render(
+                voucher=payment_data, company_name=company_name
+            )
             payment_file = (
                 output_dir
                 / f"payment_{order['name'].replace('#', '')}_{payment_data['payment_id']}.xml"
@@ -214,20 +248,211 @@ def generate_tally_xml(order_id, output_dir=Path("tally_imports")):
     return {"sales_file": sales_file, "payment_files": payment_files}
 
 
-def process_order_by_id(order_id, output_dir=Path("tally_imports")):
+def iter_tally_vouchers(order):
+    """
+    Yield the vouchers for an order: ("sales", data) followed by
+    ("payment", data) for each successful payment transaction.
+    """
+    yield "sales", prepare_sales_data(order)
+    for transaction in order.get("transactions", []):
+        if transaction.get("kind") == "SALE" and transaction.get("status") == "SUCCESS":
+            yield "payment", prepare_payment_data(order, transaction)
+
+
+def iter_orders_vouchers(orders):
+    """
+    Yield the vouchers of many orders, as iter_tally_vouchers does, skipping
+    and reporting any order whose vouchers cannot be built.
+    """
+    for order in orders:
+        try:
+            vouchers = list(iter_tally_vouchers(order))
+        except Exception as e:
+            print(f"Error processing order {order.get('name')}: {str(e)}")
+            continue
+        yield from vouchers
+
+
+def render_tally_messages(orders):
+    """
+    Render the vouchers of a chunk of orders to TALLYMESSAGE XML.
+
+    Runs in the worker processes started by write_tally_envelope.
+
+    Returns:
+        tuple: (number of vouchers, XML text)
+    """
+    vouchers = list(iter_orders_vouchers(orders))
+    xml = get_template("tally_messages.xml.j2").render(vouchers=vouchers)
+    return len(vouchers), xml
+
+
+def write_tally_envelope(orders, output_file: Path, company_name=None, processes=None):
+    """
+    Write the sales and payment vouchers of many orders into one Tally
+    import file (a single ENVELOPE).
+
+    The envelope is rendered with Template.generate() and written chunk by
+    chunk as ``orders`` is consumed, so memory use does not grow with the
+    number of orders. The file is moved into place once complete. Orders
+    whose vouchers cannot be built are reported and left out.
+
+    With ``processes``, the vouchers are rendered in chunks of orders on
+    that many worker processes and only assembled here.
+
+    Args:
+        orders: Iterable of order payloads with the orders.TALLY_ORDER_FIELDS
+            field set
+        output_file: Path of the XML file to write
+        company_name: Tally company to import into (the one open in Tally if
+            not given)
+        processes: Number of worker processes to render on (renders on this
+            thread if not given)
+
+    Returns:
+        int: Number of vouchers written
+    """
+    count = 0
+
+    def vouchers():
+        nonlocal count
+        for voucher in iter_orders_vouchers(orders):
+            count += 1
+            yield voucher
+
+    def rendered():
+        nonlocal count
+        for chunk_count, xml in process_chunks(
+            render_tally_messages, orders, processes
+        ):
+            count += chunk_count
+            yield xml
+
+    if processes:
+        context = {"rendered": rendered()}
+    else:
+        context = {"vouchers": vouchers()}
+    output_file.parent.mkdir(parents=True, exist_ok=True)
+    tmp_file = output_file.with_name(output_file.name + ".tmp")
+    template = get_template("tally_envelope.xml.j2")
+    try:
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            for chunk in template.generate(company_name=company_name, **context):
+                f.write(chunk)
+        os.replace(tmp_file, output_file)
+    except BaseException:
+        tmp_file.unlink(missing_ok=True)
+        raise
+    return count
+
+
+def iter_tally_orders(order_ids, hsn_cache=None, workers=1, store=None):
+    """
+    Yield the payloads of many orders for Tally export, fetched in
+    cost-budgeted nodes(ids:) chunks (or read from an order store), skipping
+    and reporting the ones that could not be fetched.
+    """
+    if store is not None:
+        results = store.iter_orders_details(order_ids)
+    else:
+        include_hsn = should_fetch_hsn(hsn_cache)
+        results = iter_orders_details(
+            order_ids, include_hsn, workers, TALLY_ORDER_FIELDS, hsn_cache
+        )
+    for order_id, order, error in results:
+        if error is not None:
+            print(f"Error processing order ID {order_id}: {str(error)}")
+            continue
+        yield order
+
+
+def export_tally_envelope(orders, output_file: Path, company_name=None, processes=None):
+    """
+    Write all the vouchers of many orders into one Tally import file and
+    report it
+
+    Args:
+        orders: Iterable of order payloads, as yielded by iter_tally_orders or
+            iter_orders_created_between
+        output_file: Path of the XML file to write
+        company_name: Tally company to import into
+        processes: Number of worker processes to render the vouchers on
+
+    Returns:
+        int: Number of vouchers written
+    """
+    count = write_tally_envelope(orders, output_file, company_name, processes)
+    print(f"Tally import file with {count} vouchers generated: {output_file}")
+    return count
+
+
+def generate_tally_xml(order_id, output_dir=Path("tally_imports"), hsn_cache=None):
+    """
+    Generate Tally XML import files for an order and its payments
+
+    Args:
+        order_id: Shopify order ID
+        output_dir: Directory to save XML files
+        hsn_cache: Optional hsn_cache.HsnCache to take HSN codes from
+
+    Returns:
+        dict: Paths to generated files
+    """
+    # Get order details with GraphQL
+    include_hsn = should_fetch_hsn(hsn_cache)
+    order = get_complete_order_details(order_id, include_hsn, TALLY_ORDER_FIELDS)
+    if hsn_cache is not None:
+        fill_hsn_codes(order, hsn_cache)
+
+    return write_tally_xml(order, output_dir)
+
+
+def iter_orders_created_between(start, end, hsn_cache=None, store=None):
+    """
+    Yield the orders created between two dates (inclusive), oldest first
+
+    Orders are paged through with a created_at search query, so a whole
+    period takes a handful of requests rather than one per order.
+
+    Args:
+        start: First day (date or datetime)
+        end: Last day (date or datetime)
+        hsn_cache: Optional hsn_cache.HsnCache to take HSN codes from
+        store: Optional order_store.OrderStore to read orders from instead
+
+    Yields:
+        dict: Order payloads with the orders.TALLY_ORDER_FIELDS field set
+    """
+    start = start.strftime("%Y-%m-%d")
+    end = (end + timedelta(days=1)).strftime("%Y-%m-%d")
+    if store is not None:
+        yield from store.iter_created_between(start, end)
+        return
+
+    search = f"created_at:>='{start}' created_at:<'{end}'"
+    include_hsn = should_fetch_hsn(hsn_cache)
+    for page in iter_order_pages(search, "CREATED_AT", include_hsn, TALLY_ORDER_FIELDS):
+        print(f"Fetched {len(page)} orders")
+        if hsn_cache is not None:
+            fill_orders_hsn_codes(page, hsn_cache)
+        yield from page
+
+
+def process_order_by_id(order_id, output_dir=Path("tally_imports"), hsn_cache=None):
     """
     Process a single order by its ID and generate Tally import files
 
     Args:
         order_id: Shopify order ID (numeric)
         output_dir: Directory to save output files
+        hsn_cache: Optional hsn_cache.HsnCache to take HSN codes from
 
     Returns:
         dict: Paths to generated files
     """
     try:
         print(f"Processing order ID {order_id} for Tally import...")
-        result = generate_tally_xml(order_id, output_dir)
+        result = generate_tally_xml(order_id, output_dir, hsn_cache)
 
         print(f"Sales voucher XML generated: {result['sales_file']}")
         for payment_file in result["payment_files"]:
@@ -242,13 +467,49 @@ def process_order_by_id(order_id, output_dir=Path("tally_imports")):
         return None
 
 
-def process_order_by_name(order_name, output_dir=Path("tally_imports")):
+def process_orders_by_ids(
+    order_ids, output_dir=Path("tally_imports"), hsn_cache=None, workers=1, store=None
+):
+    """
+    Generate Tally import files for many orders, fetching them in
+    cost-budgeted nodes(ids:) chunks rather than one request per order
+
+    Args:
+        order_ids: Shopify order IDs (numeric)
+        output_dir: Directory to save output files
+        hsn_cache: Optional hsn_cache.HsnCache to take HSN codes from
+        workers: Number of chunks fetched in parallel
+        store: Optional order_store.OrderStore to read orders from instead
+
+    Returns:
+        dict: Mapping of order ID to paths of generated files (None on error)
+    """
+    order_ids = list(order_ids)
+    results = dict.fromkeys(order_ids)
+    for order in iter_tally_orders(order_ids, hsn_cache, workers, store):
+        order_id = order["id"].split("/")[-1]
+        print(f"Processing order ID {order_id} for Tally import...")
+        try:
+            result = write_tally_xml(order, output_dir)
+        except Exception as e:
+            print(f"Error processing order ID {order_id}: {str(e)}")
+            continue
+
+        print(f"Sales voucher XML generated: {result['sales_file']}")
+        for payment_file in result["payment_files"]:
+            print(f"Payment voucher XML generated: {payment_file}")
+        results[order_id] = result
+    return results
+
+
+def process_order_by_name(order_name, output_dir=Path("tally_imports"), hsn_cache=None):
     """
     Process a single order by its name (e.g., "#1001") and generate Tally import files
 
     Args:
         order_name: Shopify order name including # symbol (e.g., "#1001")
         output_dir: Directory to save output files
+        hsn_cache: Optional hsn_cache.HsnCache to take HSN codes from
 
     Returns:
         dict: Paths to generated files
@@ -256,13 +517,13 @@ def process_order_by_name(order_name, output_dir=Path("tally_imports")):
     try:
         print(f"Looking up order ID for {order_name}...")
         # Get order ID from name
-        name_to_id = get_order_ids_from_names([order_name])
+        name_to_id = get_order_ids_from_names([order_name], index=OrderIndex())
         if order_name not in name_to_id:
             raise ValueError(f"Order {order_name} not found")
 
         order_id = name_to_id[order_name]
         print(f"Found order ID: {order_id}")
-        return process_order_by_id(order_id, output_dir)
+        return process_order_by_id(order_id, output_dir, hsn_cache)
     except Exception as e:
         print(f"Error processing order name {order_name}: {str(e)}")
         import traceback
@@ -271,5 +532,103 @@ def process_order_by_name(order_name, output_dir=Path("tally_imports")):
         return None
 
 
+app = typer.Typer(help="Export Shopify orders as Tally import vouchers")
+
+
+@app.command()
+def main(
+    order_names: Annotated[
+        Optional[Path],
+        typer.Argument(help="Text file containing one order name per line"),
+    ] = None,
+    start: Annotated[
+        Optional[datetime],
+        typer.Option("--from", formats=["%Y-%m-%d"], help="First order date"),
+    ] = None,
+    end: Annotated[
+        Optional[datetime],
+        typer.Option("--to", formats=["%Y-%m-%d"], help="Last order date"),
+    ] = None,
+    output_file: Annotated[
+        Path, typer.Option("--output", "-o", help="Tally import file to write")
+    ] = Path("tally_imports/tally_import.xml"),
+    company_name: Annotated[
+        Optional[str], typer.Option("--company", help="Tally company to import into")
+    ] = None,
+    workers: Annotated[
+        int,
+        typer.Option(
+            "--workers", "-w", min=1, help="Number of orders fetched in parallel"
+        ),
+    ] = 1,
+    from_store: Annotated[
+        bool,
+        typer.Option(
+            "--from-store",
+            help="Read orders from the local store filled by sync-orders",
+        ),
+    ] = False,
+    push: Annotated[
+        bool,
+        typer.Option("--push", help="Import into Tally over HTTP instead of a file"),
+    ] = False,
+    tally_url: Annotated[
+        Optional[str],
+        typer.Option("--tally-url", help="Tally XML server URL (default: TALLY_URL)"),
+    ] = None,
+    batch_size: Annotated[
+        int,
+        typer.Option("--batch-size", min=1, help="Vouchers per request with --push"),
+    ] = 100,
+    processes: Annotated[
+        Optional[int],
+        typer.Option(
+            "--processes",
+            "-p",
+            min=1,
+            help="Render vouchers on this many worker processes",
+        ),
+    ] = None,
+):
+    """Write the vouchers of the listed orders, or of a date range, to one file"""
+    if (order_names is None) == (start is None and end is None):
+        raise typer.BadParameter("Give either an order name file or --from/--to")
+    store = OrderStore() if from_store else None
+
+    if order_names is not None:
+        with open(order_names) as f:
+            names = [line.strip() for line in f if line.strip()]
+        if store is not None:
+            name_to_id = store.get_order_ids(names)
+        else:
+            name_to_id = get_order_ids_from_names(
+                names, index=OrderIndex(), allow_missing=True
+            )
+        for name in names:
+            if name not in name_to_id:
+                print(f"Order {name} not found")
+        orders = iter_tally_orders(name_to_id.values(), workers=workers, store=store)
+    else:
+        start = start or end
+        end = end or start
+        orders = iter_orders_created_between(start, end, store=store)
+
+    if push:
+        from gst_shopify.tally_push import push_to_tally
+
+        try:
+            totals = push_to_tally(orders, batch_size, company_name, tally_url)
+        except ValueError as e:
+            print(e)
+            raise typer.Exit(1)
+        print(
+            f"Tally import complete: {totals['created']} created, "
+            f"{totals['altered']} altered, {totals['errors']} errors"
+        )
+        return
+
+    export_tally_envelope(orders, output_file, company_name, processes)
+
+
 if __name__ == "__main__":
-    process_order_by_name("#AURO69593")
+    app()
@@ -0,0 +1,107 @@
+import threading
+import xml.etree.ElementTree as ET
+from itertools import islice
+
+from gst_shopify.config import get_tally_url
+from gst_shopify.tally_exports import get_template, iter_orders_vouchers
+
+DEFAULT_BATCH_SIZE = 100  # vouchers per import request
+RESPONSE_COUNTS = ("CREATED", "ALTERED", "IGNORED", "ERRORS", "EXCEPTIONS")
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """Return the keep-alive session used for requests to Tally."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            import requests
+
+            session = requests.Session()
+            session.headers.update({"Content-Type": "text/xml; charset=utf-8"})
+            _session = session
+        return _session
+
+
+def parse_import_response(text):
+    """
+    Read the import counts from Tally's response to an Import Data request.
+
+    Returns:
+        dict: The RESPONSE_COUNTS (lower-cased) and a list of LINEERROR
+        messages under "line_errors"
+    """
+    root = ET.fromstring(text)
+    result = {}
+    for name in RESPONSE_COUNTS:
+        element = root.find(f".//{name}")
+        result[name.lower()] = int(element.text) if element is not None else 0
+    result["line_errors"] = [
+        element.text.strip() for element in root.iter("LINEERROR") if element.text
+    ]
+    return result
+
+
+def post_vouchers(vouchers, company_name=None, url=None, timeout=120):
+    """
+    Send one batch of (kind, voucher) pairs to Tally as a single envelope.
+
+    Returns:
+        dict: Import counts, as returned by parse_import_response
+    """
+    body = get_template("tally_envelope.xml.j2").render(
+        vouchers=vouchers, company_name=company_name
+    )
+    response = get_session().post(
+        url or get_tally_url(), data=body.encode("utf-8"), timeout=timeout
+    )
+    response.raise_for_status()
+    return parse_import_response(response.text)
+
+
+def push_to_tally(orders, batch_size=DEFAULT_BATCH_SIZE, company_name=None, url=None):
+    """
+    Import the sales and payment vouchers of many orders straight into Tally,
+    ``batch_size`` vouchers per request, without writing any files. Orders
+    whose vouchers cannot be built are reported and left out.
+
+    Args:
+        orders: Iterable of order payloads with the orders.TALLY_ORDER_FIELDS
+            field set
+        batch_size: Vouchers sent per request
+        company_name: Tally company to import into (the one open in Tally if
+            not given)
+        url: Tally XML server URL (TALLY_URL or http://localhost:9000 if not
+            given)
+
+    Returns:
+        dict: Import counts summed over all batches
+
+    Raises:
+        ValueError: If a batch could not be sent; earlier batches have
+            already been imported
+    """
+    vouchers = iter_orders_vouchers(orders)
+    totals = {name.lower(): 0 for name in RESPONSE_COUNTS}
+    sent = 0
+    while batch := list(islice(vouchers, batch_size)):
+        try:
+            result = post_vouchers(batch, company_name, url)
+        except Exception as e:
+            raise ValueError(
+                f"Tally import stopped after {sent} vouchers were sent "
+                f"({totals['created']} created, {totals['altered']} altered, "
+                f"{totals['errors']} errors): {e}"
+            ) from e
+        sent += len(batch)
+        for name in totals:
+            totals[name] += result[name]
+        print(
+            f"Sent {sent} vouchers to Tally: {totals['created']} created, "
+            f"{totals['altered']} altered, {totals['errors']} errors"
+        )
+        for message in result["line_errors"]:
+            print(f"Tally error: {message}")
+    return totals
@@ -0,0 +1,111 @@
+import re
+import threading
+import time
+
+# Shopify's standard plan bucket; replaced by the first throttleStatus we see.
+DEFAULT_MAXIMUM_AVAILABLE = 1000.0
+DEFAULT_RESTORE_RATE = 50.0
+DEFAULT_QUERY_COST = 50.0
+SINGLE_QUERY_COST_LIMIT = 1000  # Shopify rejects queries requesting more
+MAX_TRACKED_QUERY_SHAPES = 256
+
+_STRING_LITERAL = re.compile(r'"(?:\\.|[^"\\])*"')
+
+
+def query_shape(query):
+    """
+    Key a query by its structure, ignoring string literals such as IDs and
+    cursors, so that pages of the same query share a cost estimate.
+    """
+    return _STRING_LITERAL.sub('""', query)
+
+
+class CostThrottler:
+    """
+    Client-side model of Shopify's leaky-bucket GraphQL rate limit.
+
+    Each request reserves its expected cost up front and waits only as long as
+    the bucket needs to refill. The bucket is re-synced from the
+    ``extensions.cost.throttleStatus`` block of every response.
+    """
+
+    def __init__(
+        self,
+        maximum_available=DEFAULT_MAXIMUM_AVAILABLE,
+        restore_rate=DEFAULT_RESTORE_RATE,
+    ):
+        self._lock = threading.Lock()
+        self.maximum_available = maximum_available
+        self.restore_rate = restore_rate
+        self._available = maximum_available
+        self._updated_at = time.monotonic()
+        self._in_flight = 0.0
+        self._query_costs = {}
+        self.throttled = 0
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._updated_at
+        self._available = min(
+            self.maximum_available, self._available + elapsed * self.restore_rate
+        )
+        self._updated_at = now
+
+    @property
+    def available(self):
+        with self._lock:
+            self._refill()
+            return self._available
+
+    def estimate_cost(self, query):
+        """Return the last requestedQueryCost seen for this query's shape."""
+        with self._lock:
+            return self._query_costs.get(query_shape(query), DEFAULT_QUERY_COST)
+
+    def reserve(self, cost):
+        """
+        Debit ``cost`` from the bucket and return how many seconds the caller
+        must wait before sending the request.
+        """
+        with self._lock:
+            self._refill()
+            cost = min(cost, self.maximum_available)
+            self._available -= cost
+            self._in_flight += cost
+            return max(0.0, -self._available / self.restore_rate)
+
+    def release(self, reserved):
+        """Return a reservation for a request that never reached Shopify."""
+        with self._lock:
+            self._refill()
+            self._in_flight = max(0.0, self._in_flight - reserved)
+            self._available = min(self.maximum_available, self._available + reserved)
+
+    def record_throttle(self):
+        """Count a request that Shopify rejected for lack of budget."""
+        with self._lock:
+            self.throttled += 1
+
+    def settle(self, reserved, query, cost):
+        """
+        Reconcile a reservation with the ``extensions.cost`` block of the
+        response and re-sync the bucket with Shopify's throttleStatus.
+        """
+        with self._lock:
+            self._refill()
+            self._in_flight = max(0.0, self._in_flight - reserved)
+            if not cost:
+                return
+            requested = cost.get("requestedQueryCost")
+            if requested is not None:
+                if len(self._query_costs) >= MAX_TRACKED_QUERY_SHAPES:
+                    self._query_costs.pop(next(iter(self._query_costs)))
+                self._query_costs[query_shape(query)] = float(requested)
+            status = cost.get("throttleStatus")
+            if status:
+                self.maximum_available = float(status["maximumAvailable"])
+                self.restore_rate = float(status["restoreRate"])
+                # Shopify's figure already includes this request; reservations
+                # for requests still in flight have not been charged yet.
+                self._available = float(status["currentlyAvailable"]) - self._in_flight
+                self._updated_at = time.monotonic()
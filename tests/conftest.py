@@ -0,0 +1,72 @@
+import http.server
+import threading
+
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def isolated_env(tmp_path, monkeypatch):
+    """Keep tests off the real cache directory and Shopify store."""
+    monkeypatch.setenv("GST_SHOPIFY_CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setenv("SHOPIFY_STORE", "test-store.myshopify.com")
+    monkeypatch.setenv("API_TOKEN", "test-token")
+
+
+class StandIn:
+    """
+    Local HTTP server imitating an external service.
+
+    Every request is recorded in ``requests`` as a dict of method, path,
+    headers and body. ``respond(request)`` returns the status code and either
+    the response body or an iterable of body chunks, which are sent (and
+    flushed) one at a time.
+    """
+
+    def __init__(self):
+        self.requests = []
+        self.respond = lambda request: (200, b"")
+        handler = self._handler()
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+
+    def _handler(self):
+        stand_in = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def handle_request(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                request = {
+                    "method": self.command,
+                    "path": self.path,
+                    "headers": dict(self.headers),
+                    "body": self.rfile.read(length),
+                }
+                stand_in.requests.append(request)
+                status, body = stand_in.respond(request)
+                self.send_response(status)
+                if isinstance(body, bytes):
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                    return
+                self.end_headers()
+                for chunk in body:
+                    self.wfile.write(chunk)
+                    self.wfile.flush()
+
+            do_GET = do_POST = handle_request
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+@pytest.fixture
+def stand_in():
+    server = StandIn()
+    thread = threading.Thread(target=server.server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.server.shutdown()
+    server.server.server_close()
@@ -0,0 +1,101 @@
+import json
+import threading
+
+import pytest
+
+from gst_shopify import bulk_operations
+from gst_shopify.bulk_operations import iter_bulk_pages, poll_bulk_operation
+
+OPERATION_ID = "gid://shopify/BulkOperation/1"
+
+
+class FakeShopify:
+    """Stands in for graphql_request, walking a bulk operation through statuses."""
+
+    def __init__(self, statuses, url=None, error_code=None):
+        self.statuses = list(statuses)
+        self.url = url
+        self.error_code = error_code
+        self.queries = []
+
+    def __call__(self, query, variables=None):
+        self.queries.append(query)
+        if "bulkOperationRunQuery" in query:
+            return {
+                "data": {
+                    "bulkOperationRunQuery": {
+                        "bulkOperation": {"id": OPERATION_ID, "status": "CREATED"},
+                        "userErrors": [],
+                    }
+                }
+            }
+        status = self.statuses.pop(0)
+        return {
+            "data": {
+                "node": {
+                    "id": OPERATION_ID,
+                    "status": status,
+                    "errorCode": self.error_code,
+                    "objectCount": "3",
+                    "url": self.url if status == "COMPLETED" else None,
+                }
+            }
+        }
+
+
+def jsonl_line(index, width=256):
+    """One JSONL line of exactly ``width`` bytes, newline included."""
+    line = json.dumps({"id": f"gid://shopify/ProductVariant/{index}", "pad": ""})
+    return (line[:-2] + " " * (width - len(line) - 1) + '"}\n').encode()
+
+
+def test_iter_bulk_pages_pages_streamed_results(stand_in, monkeypatch):
+    later_lines_sent = threading.Event()
+    first_page_read = threading.Event()
+    stalled = []
+
+    def respond(request):
+        def chunks():
+            yield b"".join(jsonl_line(i) for i in range(4))
+            # The rest is only sent once the first page has been consumed
+            if not first_page_read.wait(timeout=5):
+                stalled.append(True)
+            later_lines_sent.set()
+            yield b"".join(jsonl_line(i) for i in range(4, 7))
+
+        return 200, chunks()
+
+    stand_in.respond = respond
+    shopify = FakeShopify(["RUNNING", "COMPLETED"], url=f"{stand_in.url}/result")
+    monkeypatch.setattr(bulk_operations, "graphql_request", shopify)
+
+    pages = iter_bulk_pages("{ productVariants { edges { node { id } } } }", 2, 0)
+    first = next(pages)
+    assert not later_lines_sent.is_set()
+    first_page_read.set()
+    rest = list(pages)
+
+    assert not stalled
+    assert [len(page) for page in [first, *rest]] == [2, 2, 2, 1]
+    ids = [item["id"] for page in [first, *rest] for item in page]
+    assert ids == [f"gid://shopify/ProductVariant/{i}" for i in range(7)]
+    assert len(shopify.queries) == 3  # run, then two polls
+    # The signed result URL must not receive the Shopify token
+    assert "X-Shopify-Access-Token" not in stand_in.requests[0]["headers"]
+
+
+def test_iter_bulk_pages_without_results(monkeypatch):
+    monkeypatch.setattr(
+        bulk_operations, "graphql_request", FakeShopify(["COMPLETED"], url=None)
+    )
+    assert list(iter_bulk_pages("{ products { edges { node { id } } } }", 2, 0)) == []
+
+
+@pytest.mark.parametrize("status", ["FAILED", "CANCELED"])
+def test_poll_raises_when_operation_does_not_complete(status, monkeypatch):
+    shopify = FakeShopify(["RUNNING", status], error_code="ACCESS_DENIED")
+    monkeypatch.setattr(bulk_operations, "graphql_request", shopify)
+
+    with pytest.raises(ValueError, match=f"{status.lower()}: ACCESS_DENIED"):
+        poll_bulk_operation(OPERATION_ID, poll_interval=0)
+    assert len(shopify.queries) == 2
@@ -0,0 +1,82 @@
+import pytest
+
+from gst_shopify import catalog
+from gst_shopify.catalog import CatalogMirror, refresh_catalog
+from gst_shopify.local_store import connect
+
+
+def variant(variant_id, updated_at, hsn_code="61091000"):
+    return {
+        "id": variant_id,
+        "sku": f"SKU-{variant_id}",
+        "updatedAt": updated_at,
+        "inventoryItem": {
+            "id": f"item-{variant_id}",
+            "harmonizedSystemCode": hsn_code,
+        },
+        "product": {"status": "ACTIVE"},
+    }
+
+
+@pytest.fixture
+def mirror(tmp_path):
+    return CatalogMirror(connect(tmp_path / "store.sqlite"))
+
+
+def mirrored_ids(mirror):
+    return [v["id"] for page in mirror.iter_variant_pages() for v in page]
+
+
+def test_interrupted_refresh_keeps_watermark(mirror, monkeypatch):
+    def pages(**kwargs):
+        yield [variant("v1", "2024-06-01T00:00:00Z")]
+        raise ConnectionError("connection lost")
+
+    monkeypatch.setattr(catalog, "iter_variant_pages", pages)
+    with pytest.raises(ConnectionError):
+        refresh_catalog(mirror)
+    assert mirror.watermark is None
+
+    searches = []
+
+    def all_pages(search=None, **kwargs):
+        searches.append(search)
+        yield [variant("v1", "2024-06-01T00:00:00Z")]
+        yield [variant("v2", "2024-01-01T00:00:00Z")]
+
+    monkeypatch.setattr(catalog, "iter_variant_pages", all_pages)
+    refresh_catalog(mirror)
+    assert searches == [None]
+    assert mirrored_ids(mirror) == ["v1", "v2"]
+    assert mirror.watermark is not None
+
+
+def test_incremental_refresh_searches_from_watermark(mirror, monkeypatch):
+    mirror.set_watermark("2024-06-01T00:00:00Z")
+    searches = []
+
+    def pages(search=None, **kwargs):
+        searches.append(search)
+        yield [variant("v1", "2024-06-02T00:00:00Z")]
+
+    monkeypatch.setattr(catalog, "iter_variant_pages", pages)
+    refresh_catalog(mirror)
+    assert searches == ["updated_at:>='2024-06-01T00:00:00Z'"]
+    assert mirror.watermark > "2024-06-01T00:00:00Z"
+
+
+def test_full_refresh_drops_deleted_variants(mirror, monkeypatch):
+    mirror.save_page(
+        [variant("v1", "2024-01-01T00:00:00Z"), variant("v2", "2024-01-01T00:00:00Z")]
+    )
+    mirror.set_watermark("2024-06-01T00:00:00Z")
+
+    def pages(**kwargs):
+        yield [variant("v1", "2024-01-01T00:00:00Z")]
+
+    monkeypatch.setattr(catalog, "iter_variant_pages", pages)
+    refresh_catalog(mirror)
+    assert mirrored_ids(mirror) == ["v1", "v2"]  # incremental: nothing removed
+
+    refresh_catalog(mirror, full=True)
+    assert mirrored_ids(mirror) == ["v1"]
@@ -0,0 +1,46 @@
+from gst_shopify.checkpoint import Checkpoint, file_key
+
+
+def test_resumes_for_same_key(tmp_path):
+    path = tmp_path / "checkpoint.json"
+    checkpoint = Checkpoint(path, "key", save_interval=0)
+    checkpoint.set_cursor("cursor-2")
+    checkpoint.mark_done("#1001")
+
+    resumed = Checkpoint(path, "key")
+    assert resumed.cursor == "cursor-2"
+    assert resumed.done == {"#1001"}
+
+
+def test_ignores_other_key(tmp_path):
+    path = tmp_path / "checkpoint.json"
+    Checkpoint(path, "key").set_cursor("cursor-2")
+
+    other = Checkpoint(path, "other key")
+    assert other.cursor is None
+    assert other.done == set()
+
+
+def test_mark_done_saves_at_most_every_interval(tmp_path):
+    path = tmp_path / "checkpoint.json"
+    checkpoint = Checkpoint(path, "key", save_interval=3600)
+    checkpoint.mark_done("#1001")
+    checkpoint.mark_done("#1002")
+    assert Checkpoint(path, "key").done == {"#1001"}
+
+    checkpoint.save()
+    assert Checkpoint(path, "key").done == {"#1001", "#1002"}
+
+
+def test_file_key_changes_when_file_is_edited(tmp_path):
+    input_file = tmp_path / "hsn.csv"
+    input_file.write_text("SKU,HSN Code\nA,61091000\n")
+    key = file_key(input_file)
+    assert key == file_key(input_file)
+
+    checkpoint_file = tmp_path / "checkpoint.json"
+    Checkpoint(checkpoint_file, key).set_cursor("cursor-2")
+
+    input_file.write_text("SKU,HSN Code\nA,61099090\n")
+    assert file_key(input_file) != key
+    assert Checkpoint(checkpoint_file, file_key(input_file)).cursor is None
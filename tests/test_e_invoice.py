@@ -0,0 +1,108 @@
+import json
+
+import pytest
+
+from gst_shopify import config, e_invoice_exp_lut, orders
+from gst_shopify.e_invoice_exp_lut import generate_invoices, get_latest_fulfillment_date
+from gst_shopify.order_store import OrderStore
+
+
+@pytest.fixture(autouse=True)
+def shop_timezone():
+    config.get_shop_timezone.cache_clear()
+    yield
+    config.get_shop_timezone.cache_clear()
+
+
+def order(*fulfilled_at):
+    return {
+        "name": "#1001",
+        "createdAt": "2024-03-30T10:00:00Z",
+        "fulfillments": [{"createdAt": timestamp} for timestamp in fulfilled_at],
+    }
+
+
+def test_fulfillment_date_is_in_shop_timezone():
+    # 01:30 IST on 2 April
+    assert get_latest_fulfillment_date(order("2024-04-01T20:00:00Z")) == "02/04/2024"
+
+
+def test_latest_fulfillment_wins():
+    dates = ("2024-04-01T10:00:00Z", "2024-04-03T10:00:00Z", "2024-04-02T10:00:00Z")
+    assert get_latest_fulfillment_date(order(*dates)) == "03/04/2024"
+
+
+def test_timestamp_with_offset():
+    assert get_latest_fulfillment_date(order("2024-04-02T01:30:00+05:30")) == (
+        "02/04/2024"
+    )
+
+
+def test_shop_timezone_from_environment(monkeypatch):
+    monkeypatch.setenv("SHOP_TIMEZONE", "UTC")
+    assert get_latest_fulfillment_date(order("2024-04-01T20:00:00Z")) == "01/04/2024"
+
+
+def test_falls_back_to_order_date():
+    messages = []
+    assert get_latest_fulfillment_date(order(), messages.append) == "30/03/2024"
+    assert "No fulfillment date" in messages[0]
+
+
+def stored_order(number):
+    return {
+        "id": f"gid://shopify/Order/{number}",
+        "name": f"#{number}",
+        "createdAt": "2024-04-01T10:00:00Z",
+        "updatedAt": "2024-04-02T10:00:00Z",
+        "fulfillments": [{"createdAt": "2024-04-01T12:00:00Z"}],
+        "customer": {"firstName": "Asha", "lastName": "Rao"},
+        "shippingAddress": {"address1": "1 Main St", "city": "Auroville"},
+        "totalShippingPriceSet": {"shopMoney": {"amount": "0.00"}},
+        "totalDiscountsSet": {"shopMoney": {"amount": "0.00"}},
+        "lineItems": {
+            "edges": [
+                {
+                    "node": {
+                        "name": "Incense",
+                        "title": "Incense",
+                        "quantity": 2,
+                        "fulfillmentStatus": "FULFILLED",
+                        "originalUnitPriceSet": {"shopMoney": {"amount": "50.00"}},
+                        "totalDiscountSet": {"shopMoney": {"amount": "0.00"}},
+                        "variant": {
+                            "id": "gid://shopify/ProductVariant/1",
+                            "inventoryItem": {"harmonizedSystemCode": "33074100"},
+                        },
+                    }
+                }
+            ]
+        },
+    }
+
+
+def test_store_run_skips_unknown_names_without_api_calls(tmp_path, monkeypatch, capsys):
+    def no_api_calls(*args, **kwargs):
+        raise AssertionError("a --from-store run must not call Shopify")
+
+    monkeypatch.setattr(orders, "async_graphql_request", no_api_calls)
+    monkeypatch.setattr(orders, "graphql_request", no_api_calls)
+    monkeypatch.setattr(
+        e_invoice_exp_lut, "get_seller_details", lambda: {"Gstin": "33AAAAA0000A1Z5"}
+    )
+    store = OrderStore()
+    store.save_page([stored_order(1001), stored_order(1002)])
+    names = tmp_path / "names.txt"
+    names.write_text("#1001\n#9999\n#1002\n")
+
+    generate_invoices(names, tmp_path / "invoices", store=store)
+
+    out = capsys.readouterr().out
+    assert "Order #9999 is not in the local store; run sync-orders" in out
+    invoices = tmp_path / "invoices"
+    written = sorted(path.name for path in invoices.glob("exp_invoice_*.json"))
+    assert written == ["exp_invoice_#1001.json", "exp_invoice_#1002.json"]
+    invoice = json.loads((invoices / written[0]).read_text())
+    assert invoice[0]["ValDtls"]["TotInvVal"] == 100
+    # #9999 stays pending in the checkpoint for a rerun after sync-orders
+    assert "Some invoices could not be generated" in out
@@ -0,0 +1,135 @@
+import csv
+import io
+
+import re
+
+from gst_shopify import hsn_cache as hsn_cache_module
+from gst_shopify import orders
+from gst_shopify.hsn_cache import HsnCache, should_fetch_hsn
+from gst_shopify.hsn_update import _record_results
+
+
+def test_set_hsn_codes_updates_entries_by_inventory_item(tmp_path):
+    cache = HsnCache(path=tmp_path / "hsn_cache.json")
+    cache.put("v1", "item-1", "61091000")
+    cache.put("v2", "item-2", "61091000")
+    assert cache.set_hsn_codes(["item-1", "item-9"], ["61099090", "42022190"]) == 1
+    assert cache.get("v1") == ("item-1", "61099090")
+    assert cache.get("v2") == ("item-2", "61091000")
+
+    cache.save()
+    assert HsnCache(path=tmp_path / "hsn_cache.json").get("v1") == (
+        "item-1",
+        "61099090",
+    )
+
+
+def test_record_results_updates_cache_for_successful_updates():
+    cache = HsnCache()
+    cache.put("v1", "item-1", "61091000")
+    cache.put("v2", "item-2", "61091000")
+    updates = [("SKU-1", "item-1", "61099090"), ("SKU-2", "item-2", "42022190")]
+    out = io.StringIO()
+
+    processed = _record_results(
+        csv.writer(out), updates, [None, "bad code"], None, cache
+    )
+
+    assert processed == 1
+    assert cache.get("v1") == ("item-1", "61099090")
+    assert cache.get("v2") == ("item-2", "61091000")
+    rows = list(csv.reader(io.StringIO(out.getvalue())))
+    assert rows == [
+        ["SKU-1", "item-1", "61099090", "updated", ""],
+        ["SKU-2", "item-2", "42022190", "error", "bad code"],
+    ]
+
+
+def test_hsn_is_fetched_unless_cache_has_codes(monkeypatch, tmp_path):
+    assert should_fetch_hsn(None)
+
+    cache = HsnCache()
+    assert should_fetch_hsn(cache)
+
+    path = tmp_path / "hsn_cache.json"
+    cache.put("v1", "item-1", "61091000")
+    cache.path = path
+    cache.save()
+    assert not should_fetch_hsn(HsnCache(path=path))
+
+    cache = HsnCache()
+
+    def pages(**kwargs):
+        yield [
+            {
+                "id": "v2",
+                "inventoryItem": {"id": "item-2", "harmonizedSystemCode": "42022190"},
+            }
+        ]
+
+    monkeypatch.setattr(hsn_cache_module, "iter_variant_pages", pages)
+    cache.prewarm()
+    assert cache.get("v2") == ("item-2", "42022190")
+    assert not should_fetch_hsn(cache)
+
+
+def line_item(variant_id):
+    return {"node": {"name": variant_id, "variant": {"id": variant_id}}}
+
+
+def test_cache_misses_are_fetched_once_per_chunk(monkeypatch, tmp_path):
+    path = tmp_path / "hsn_cache.json"
+    cache = HsnCache(path=path)
+    cache.put("v1", "item-1", "61091000")
+    cache.save()
+    cache = HsnCache(path=path)
+    assert not should_fetch_hsn(cache)
+
+    variants = {"1": ["v1"], "2": ["v2", "v1"], "3": ["v3"], "4": ["v2"]}
+
+    def order_nodes(query):
+        assert "inventoryItem" not in query
+        ids = re.findall(r"gid://shopify/Order/(\d+)", query)
+        nodes = [
+            {
+                "id": f"gid://shopify/Order/{order_id}",
+                "lineItems": {"edges": [line_item(v) for v in variants[order_id]]},
+            }
+            for order_id in ids
+        ]
+        cost = {"requestedQueryCost": 10 * len(ids)}
+        return {"data": {"nodes": nodes}, "extensions": {"cost": cost}}
+
+    hsn_queries = []
+
+    def inventory_nodes(query):
+        ids = re.findall(r'"(v\d+)"', query)
+        hsn_queries.append(ids)
+        nodes = [
+            {"id": v, "inventoryItem": {"id": f"item-{v}", "harmonizedSystemCode": v}}
+            for v in ids
+        ]
+        return {"data": {"nodes": nodes}}
+
+    monkeypatch.setattr(orders, "_order_query_costs", {})
+    monkeypatch.setattr(orders, "graphql_request", order_nodes)
+    monkeypatch.setattr(hsn_cache_module, "graphql_request", inventory_nodes)
+
+    results = list(
+        orders.iter_orders_details(
+            ["1", "2", "3", "4"], False, hsn_cache=cache, fields=("OrderCore",)
+        )
+    )
+
+    # Order 1 is fetched alone to learn the query cost; its variant is cached.
+    # The other three come in one chunk whose misses share one request.
+    assert hsn_queries == [["v2", "v3"]]
+    codes = [
+        [
+            edge["node"]["variant"]["inventoryItem"]["harmonizedSystemCode"]
+            for edge in order["lineItems"]["edges"]
+        ]
+        for _, order, _ in results
+    ]
+    assert codes == [["61091000"], ["v2", "61091000"], ["v3"], ["v2"]]
+    assert cache.get("v3") == ("item-v3", "v3")
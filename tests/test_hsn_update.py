@@ -0,0 +1,262 @@
+import csv
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from gst_shopify import bulk_operations, hsn_update
+from gst_shopify.bulk_operations import staged_upload_jsonl
+from gst_shopify.catalog import CatalogMirror
+from gst_shopify.hsn_update import (
+    UPDATE_BATCH_SIZE,
+    UpdateBatchSize,
+    batch_update_hsn_codes,
+    process_inventory_items,
+)
+from gst_shopify.local_store import connect
+from gst_shopify.throttle import SINGLE_QUERY_COST_LIMIT
+
+STAGED_KEY = "tmp/bulk/vars.jsonl"
+
+
+def fake_bulk_shopify(upload_url, result_url):
+    """Stands in for graphql_request through a whole bulk mutation."""
+
+    def graphql_request(query, variables=None):
+        if "stagedUploadsCreate" in query:
+            parameters = [
+                {"name": "key", "value": STAGED_KEY},
+                {"name": "policy", "value": "signed-policy"},
+            ]
+            target = {"url": upload_url, "parameters": parameters}
+            return {
+                "data": {
+                    "stagedUploadsCreate": {
+                        "stagedTargets": [target],
+                        "userErrors": [],
+                    }
+                }
+            }
+        if "bulkOperationRunMutation" in query:
+            assert f'stagedUploadPath: "{STAGED_KEY}"' in query
+            operation = {"id": "gid://shopify/BulkOperation/2", "status": "CREATED"}
+            return {
+                "data": {
+                    "bulkOperationRunMutation": {
+                        "bulkOperation": operation,
+                        "userErrors": [],
+                    }
+                }
+            }
+        return {
+            "data": {
+                "node": {
+                    "id": "gid://shopify/BulkOperation/2",
+                    "status": "COMPLETED",
+                    "errorCode": None,
+                    "objectCount": "2",
+                    "url": result_url,
+                }
+            }
+        }
+
+    return graphql_request
+
+
+def uploaded_lines(request):
+    """The JSONL lines of the file part of a multipart upload."""
+    return [
+        json.loads(line)
+        for line in request["body"].decode().splitlines()
+        if line.startswith("{")
+    ]
+
+
+def test_staged_upload_drops_shopify_headers(stand_in, monkeypatch):
+    stand_in.respond = lambda request: (201, b"")
+    monkeypatch.setattr(
+        bulk_operations,
+        "graphql_request",
+        fake_bulk_shopify(f"{stand_in.url}/upload", None),
+    )
+
+    lines = [{"id": "item-1"}, {"id": "item-2"}]
+    assert staged_upload_jsonl(lines) == STAGED_KEY
+
+    [request] = stand_in.requests
+    assert request["method"] == "POST"
+    assert "X-Shopify-Access-Token" not in request["headers"]
+    assert request["headers"]["Content-Type"].startswith("multipart/form-data")
+    assert b"signed-policy" in request["body"]
+    assert uploaded_lines(request) == lines
+
+
+def variant(number, hsn_code):
+    return {
+        "id": f"gid://shopify/ProductVariant/{number}",
+        "sku": f"SKU-{number}",
+        "updatedAt": "2024-01-01T00:00:00Z",
+        "inventoryItem": {
+            "id": f"gid://shopify/InventoryItem/{number}",
+            "harmonizedSystemCode": hsn_code,
+        },
+        "product": {"status": "ACTIVE"},
+    }
+
+
+def update_result(line_number, user_errors=()):
+    return {
+        "data": {
+            "inventoryItemUpdate": {
+                "inventoryItem": None if user_errors else {"id": "..."},
+                "userErrors": list(user_errors),
+            }
+        },
+        "__lineNumber": line_number,
+    }
+
+
+def test_bulk_mutation_results_are_mapped_by_line_number(
+    stand_in, tmp_path, monkeypatch
+):
+    mirror = CatalogMirror(connect(tmp_path / "store.sqlite"))
+    mirror.save_page(
+        [
+            variant(1, "61091000"),
+            variant(2, "61091000"),
+            variant(3, "33074100"),  # already correct
+            variant(4, "61091000"),
+        ]
+    )
+    input_file = tmp_path / "hsn.csv"
+    input_file.write_text(
+        "sku,hsncode\nSKU-1,61099090\nSKU-2,12\nSKU-3,33074100\nSKU-4,42022190\n"
+    )
+
+    # Results come back out of order, and line 2 has none at all
+    invalid = {"field": ["input", "harmonizedSystemCode"], "message": "is invalid"}
+    results = [update_result(1, [invalid]), update_result(0)]
+
+    def respond(request):
+        if request["method"] == "POST":
+            return 201, b""
+        return 200, b"".join(json.dumps(r).encode() + b"\n" for r in results)
+
+    stand_in.respond = respond
+    monkeypatch.setattr(
+        bulk_operations,
+        "graphql_request",
+        fake_bulk_shopify(f"{stand_in.url}/upload", f"{stand_in.url}/result"),
+    )
+    monkeypatch.setattr(bulk_operations, "POLL_INTERVAL", 0)
+
+    results_file = tmp_path / "results.csv"
+    process_inventory_items(
+        input_file,
+        250,
+        mirror=mirror,
+        results_file=results_file,
+        bulk_mutation=True,
+    )
+
+    assert [line["id"] for line in uploaded_lines(stand_in.requests[0])] == [
+        "gid://shopify/InventoryItem/1",
+        "gid://shopify/InventoryItem/2",
+        "gid://shopify/InventoryItem/4",
+    ]
+    with open(results_file, newline="") as f:
+        rows = list(csv.DictReader(f))
+    assert [(row["sku"], row["status"], row["errors"]) for row in rows] == [
+        ("SKU-1", "updated", ""),
+        ("SKU-2", "error", "input.harmonizedSystemCode: is invalid"),
+        ("SKU-4", "error", "No result returned"),
+    ]
+    codes = {
+        v["sku"]: v["inventoryItem"]["harmonizedSystemCode"]
+        for page in mirror.iter_variant_pages()
+        for v in page
+    }
+    assert codes == {
+        "SKU-1": "61099090",
+        "SKU-2": "61091000",
+        "SKU-3": "33074100",
+        "SKU-4": "61091000",
+    }
+
+
+def test_batched_updates_read_each_alias(monkeypatch):
+    def graphql_request(query, variables=None):
+        count = query.count("inventoryItemUpdate(")
+        data = {
+            f"updateInventoryItem_{i}": {
+                "inventoryItem": {"id": "..."},
+                "userErrors": (
+                    [{"field": None, "message": "Throttled"}] if i == 1 else []
+                ),
+            }
+            for i in range(count)
+        }
+        return {"data": data}
+
+    monkeypatch.setattr(hsn_update, "graphql_request", graphql_request)
+    ids = [f"gid://shopify/InventoryItem/{i}" for i in range(5)]
+
+    errors = batch_update_hsn_codes(ids, ["61091000"] * 5, UpdateBatchSize(size=3))
+
+    # Batches of 3 and 2; the second item of each reports an error
+    assert errors == ["", "Throttled", "", "", "Throttled"]
+
+
+@pytest.fixture
+def bucket(monkeypatch):
+    """Stubbed throttler whose headroom and throttle count a test sets."""
+    stub = SimpleNamespace(throttled=0, available=1000.0, maximum_available=1000.0)
+    monkeypatch.setattr(hsn_update, "throttler", stub)
+    return stub
+
+
+def batch_cost(count, per_mutation=10):
+    cost = count * per_mutation
+    return {"requestedQueryCost": cost, "actualQueryCost": cost}
+
+
+def test_batch_size_doubles_while_bucket_has_room(bucket):
+    size = UpdateBatchSize()
+    size.update(3, batch_cost(3))
+    assert size.size == 6
+
+    # 100 points left: room for 10 more mutations but not for 12
+    bucket.available = 100.0
+    size.update(6, batch_cost(6))
+    assert size.size == 6
+
+
+def test_batch_size_halves_after_a_new_throttle(bucket):
+    size = UpdateBatchSize(size=40)
+    bucket.throttled += 1
+    size.update(40, batch_cost(40))
+    assert size.size == 20
+
+    # The same throttle is not counted twice
+    bucket.available = 0.0
+    size.update(20, batch_cost(20))
+    assert size.size == 20
+
+
+def test_batch_size_is_capped_by_single_query_cost_limit(bucket):
+    bucket.available = bucket.maximum_available = 20_000.0
+    size = UpdateBatchSize()
+    for _ in range(10):
+        size.update(size.size, batch_cost(size.size, per_mutation=12))
+    assert size.size == SINGLE_QUERY_COST_LIMIT // 12
+
+    # A smaller bucket lowers the cap
+    bucket.maximum_available = 500.0
+    size.update(size.size, batch_cost(size.size, per_mutation=12))
+    assert size.size == 500 // 12
+
+
+def test_batch_size_unchanged_without_cost(bucket):
+    size = UpdateBatchSize()
+    size.update(3, {})
+    assert size.size == UPDATE_BATCH_SIZE
@@ -0,0 +1,109 @@
+import json
+import random
+from decimal import Decimal
+
+import pytest
+
+from gst_shopify.e_invoice_exp_lut import (
+    build_invoice,
+    generate_gst_invoice_data,
+    invoice_to_json,
+)
+
+SELLER = {"Gstin": "33AAAAA0000A1Z5", "LglNm": "Seller", "Pin": 605101}
+
+
+def money(amount):
+    return {"shopMoney": {"amount": amount}}
+
+
+def random_amount(rng):
+    return rng.choice(
+        [None, "0.00", "7", f"{rng.randint(1, 999_999) / 100:.2f}"]
+        + [f"{rng.randint(1, 99_999) / 1000:.3f}"]
+    )
+
+
+def random_order(rng, number):
+    edges = [
+        {
+            "node": {
+                "name": f"Item {i}",
+                "title": f"Item {i}",
+                "quantity": rng.randint(1, 12),
+                "fulfillmentStatus": rng.choice(["FULFILLED"] * 4 + ["UNFULFILLED"]),
+                "originalUnitPriceSet": money(random_amount(rng)),
+                "totalDiscountSet": money(rng.choice([None, "0.00", "1.005", "3.33"])),
+                "variant": rng.choice(
+                    [None, {"inventoryItem": {"harmonizedSystemCode": "61091000"}}]
+                ),
+            }
+        }
+        for i in range(rng.randint(0, 6))
+    ]
+    return {
+        "name": f"#{number}",
+        "createdAt": "2024-04-01T10:00:00Z",
+        "fulfillments": [{"createdAt": "2024-04-01T20:00:00Z"}],
+        "customer": rng.choice([None, {"firstName": "Asha", "lastName": None}]),
+        "shippingAddress": {"address1": "1 Main St", "city": "Auroville"},
+        "totalShippingPriceSet": money(random_amount(rng)),
+        "totalDiscountsSet": money(rng.choice([None, "0.00", "2.50"])),
+        "lineItems": {"edges": edges},
+    }
+
+
+def random_invoices(count=300, seed=25):
+    rng = random.Random(seed)
+    invoices = []
+    for number in range(count):
+        try:
+            invoices.append(build_invoice(random_order(rng, number), SELLER, str))
+        except ValueError:
+            continue  # no fulfilled items and no shipping
+    return invoices
+
+
+def test_json_fast_path_matches_decimal_payload():
+    invoices = random_invoices()
+    assert len(invoices) > 200
+    for invoice in invoices:
+        assert invoice_to_json(invoice) == invoice_to_json(invoice.to_dict())
+
+
+def test_payload_keeps_schema_order_and_decimals():
+    rng = random.Random(1)
+    order = random_order(rng, 1)
+    order["totalShippingPriceSet"] = money("12.50")
+    invoice = generate_gst_invoice_data(order, SELLER, str)
+
+    shipping = invoice["ItemList"][-1]
+    assert list(shipping)[:6] == [
+        "SlNo",
+        "PrdDesc",
+        "IsServc",
+        "HsnCd",
+        "Qty",
+        "FreeQty",
+    ]
+    assert list(shipping)[-1] == "TotItemVal"
+    assert shipping["HsnCd"] == "996811"
+    assert all(isinstance(value, Decimal) for key, value in invoice["ValDtls"].items())
+    assert invoice["DocDtls"]["Dt"] == "02/04/2024"
+
+
+def test_payloads_do_not_share_mutable_state():
+    first, second = random_invoices(count=20)[:2]
+    payload = first.to_dict()
+    payload["TranDtls"]["SupTyp"] = "B2B"
+    payload["ItemList"][0]["GstRt"] = Decimal("18")
+    assert second.to_dict()["TranDtls"]["SupTyp"] == "EXPWOP"
+    assert json.loads(invoice_to_json(second))[0]["ItemList"][0]["GstRt"] == 0
+
+
+def test_order_without_items_is_rejected():
+    order = random_order(random.Random(2), 7)
+    order["lineItems"]["edges"] = []
+    order["totalShippingPriceSet"] = money("0.00")
+    with pytest.raises(ValueError, match="no valid items"):
+        build_invoice(order, SELLER, str)
@@ -0,0 +1,73 @@
+from gst_shopify import order_store
+from gst_shopify.order_store import OrderStore, sync_orders
+
+
+def stored_order(number, updated_at):
+    return {
+        "id": f"gid://shopify/Order/{number}",
+        "name": f"#{number}",
+        "createdAt": "2024-04-01T10:00:00Z",
+        "updatedAt": updated_at,
+    }
+
+
+def test_save_page_advances_watermark_to_latest_update():
+    store = OrderStore()
+    assert store.watermark is None
+
+    store.save_page([])
+    assert store.watermark is None
+
+    store.save_page(
+        [
+            stored_order(1, "2024-04-02T10:00:00Z"),
+            stored_order(2, "2024-04-03T10:00:00Z"),
+            stored_order(3, "2024-04-01T10:00:00Z"),
+        ]
+    )
+    assert store.watermark == "2024-04-03T10:00:00Z"
+
+    # An older page (e.g. a full resync) upserts without moving it back
+    store.save_page([stored_order(1, "2024-04-02T12:00:00Z")])
+    assert store.watermark == "2024-04-03T10:00:00Z"
+    assert len(store) == 3
+    assert store.get_many(["1"])["1"]["updatedAt"] == "2024-04-02T12:00:00Z"
+
+
+def test_get_order_ids_keeps_input_order_and_skips_unknown_names():
+    store = OrderStore()
+    store.save_page([stored_order(n, "2024-04-02T10:00:00Z") for n in (1, 2, 3)])
+
+    name_to_id = store.get_order_ids(["#3", "#9", "#1"])
+
+    assert list(name_to_id.items()) == [("#3", "3"), ("#1", "1")]
+
+
+def test_sync_orders_searches_from_the_watermark(monkeypatch):
+    searches = []
+    pages = [
+        [stored_order(1, "2024-04-02T10:00:00Z")],
+        [stored_order(2, "2024-04-05T10:00:00Z")],
+    ]
+
+    def iter_order_pages(search, sort_key, include_hsn, fields):
+        searches.append((search, sort_key, include_hsn))
+        yield from pages
+
+    monkeypatch.setattr(order_store, "iter_order_pages", iter_order_pages)
+    store = OrderStore()
+
+    assert sync_orders(store) == 2
+    assert store.watermark == "2024-04-05T10:00:00Z"
+
+    pages = [[stored_order(2, "2024-04-06T10:00:00Z")]]
+    assert sync_orders(store) == 1
+    assert store.watermark == "2024-04-06T10:00:00Z"
+
+    sync_orders(store, full=True)
+    assert searches == [
+        ("", "UPDATED_AT", True),
+        ("updated_at:>='2024-04-05T10:00:00Z'", "UPDATED_AT", True),
+        ("", "UPDATED_AT", True),
+    ]
+    assert len(store) == 2
@@ -0,0 +1,61 @@
+import os
+import shutil
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+SRC_DIR = Path(__file__).parents[1] / "src"
+STARTUP_BUDGET = 1.0  # seconds, including the interpreter's own startup
+HEAVY_MODULES = ("requests", "pandas", "jinja2", "dateutil")
+
+# Reports which heavy modules were imported, once the command has exited
+REPORT_MODULES = (
+    "import atexit, sys; "
+    "atexit.register(lambda: print('loaded:', "
+    f"[m for m in {HEAVY_MODULES!r} if m in sys.modules]))"
+)
+
+
+def run(args):
+    """Run a command without Shopify credentials; return (stdout, seconds)."""
+    env = {
+        key: value
+        for key, value in os.environ.items()
+        if key not in ("SHOPIFY_STORE", "API_TOKEN")
+    }
+    env["PYTHONPATH"] = os.pathsep.join(
+        filter(None, [str(SRC_DIR), env.get("PYTHONPATH")])
+    )
+    timings = []
+    for _ in range(3):
+        start = time.perf_counter()
+        result = subprocess.run(
+            args, env=env, capture_output=True, text=True, check=True
+        )
+        timings.append(time.perf_counter() - start)
+    return result.stdout, min(timings)
+
+
+@pytest.mark.parametrize(
+    "code",
+    [
+        "import gst_shopify.cli",
+        # What the gen-invoice entry point runs
+        "from gst_shopify.cli import app; app()",
+    ],
+    ids=["import", "help"],
+)
+def test_startup_is_fast_and_lazy(code):
+    stdout, seconds = run([sys.executable, "-c", f"{REPORT_MODULES}; {code}", "--help"])
+    assert "loaded: []" in stdout
+    assert seconds < STARTUP_BUDGET
+
+
+@pytest.mark.skipif(shutil.which("gen-invoice") is None, reason="not installed")
+def test_installed_gen_invoice_help_is_fast():
+    stdout, seconds = run(["gen-invoice", "--help"])
+    assert "Generate GST invoices" in stdout
+    assert seconds < STARTUP_BUDGET
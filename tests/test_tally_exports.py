@@ -0,0 +1,149 @@
+import xml.etree.ElementTree as ET
+
+import pytest
+from typer.testing import CliRunner
+
+from gst_shopify import orders
+from gst_shopify.order_store import OrderStore
+from gst_shopify.tally_exports import (
+    app,
+    process_orders_by_ids,
+    write_tally_envelope,
+    write_tally_xml,
+)
+
+
+def shopify_order(number):
+    return {
+        "id": f"gid://shopify/Order/{number}",
+        "name": f"#{number}",
+        "createdAt": "2024-04-01T10:00:00Z",
+        "updatedAt": "2024-04-02T10:00:00Z",
+        "customer": {"firstName": "Asha", "lastName": "Rao"},
+        "shippingAddress": {"address1": "1 Main St", "province": "Karnataka"},
+        "subtotalPriceSet": {"shopMoney": {"amount": "100.00"}},
+        "totalPriceSet": {"shopMoney": {"amount": "100.00"}},
+        "totalTaxSet": {"shopMoney": {"amount": "0.00"}},
+        "taxLines": [],
+        "lineItems": {
+            "edges": [
+                {
+                    "node": {
+                        "name": "Incense",
+                        "quantity": 2,
+                        "variant": {
+                            "price": "50.00",
+                            "inventoryItem": {"harmonizedSystemCode": "33074100"},
+                        },
+                        "discountedTotalSet": {"shopMoney": {"amount": "100.00"}},
+                    }
+                }
+            ]
+        },
+        "transactions": [],
+    }
+
+
+def test_unknown_order_names_are_reported_and_skipped(tmp_path, monkeypatch):
+    OrderStore().save_page([shopify_order(1001)])
+
+    async def no_api_calls(query, semaphore=None):
+        raise AssertionError("a --from-store run must not call Shopify")
+
+    monkeypatch.setattr(orders, "async_graphql_request", no_api_calls)
+    names = tmp_path / "names.txt"
+    names.write_text("#1001\n#9999\n")
+    output = tmp_path / "tally.xml"
+
+    result = CliRunner().invoke(
+        app, [str(names), "--from-store", "--output", str(output)]
+    )
+
+    assert result.exit_code == 0, result.output
+    assert "Order #9999 not found" in result.output
+    numbers = [element.text for element in ET.parse(output).iter("VOUCHERNUMBER")]
+    assert numbers == ["1001"]
+
+
+def test_per_order_files_leave_company_unset(tmp_path):
+    order = shopify_order(1002)
+    order["transactions"] = [
+        {
+            "id": "gid://shopify/OrderTransaction/5",
+            "kind": "SALE",
+            "status": "SUCCESS",
+            "gateway": "razorpay",
+            "processedAt": "2024-04-01T10:05:00Z",
+            "amountSet": {"shopMoney": {"amount": "100.00"}},
+        }
+    ]
+
+    files = write_tally_xml(order, tmp_path)
+
+    for path in [files["sales_file"], *files["payment_files"]]:
+        root = ET.parse(path).getroot()
+        assert root.find(".//SVCURRENTCOMPANY") is None
+        assert len(root.findall(".//VOUCHER")) == 1
+
+    files = write_tally_xml(order, tmp_path, company_name="Auroville Online")
+    root = ET.parse(files["sales_file"]).getroot()
+    assert root.find(".//SVCURRENTCOMPANY").text == "Auroville Online"
+
+
+def test_null_customer_and_variant_are_exported(tmp_path):
+    guest = shopify_order(1003)
+    guest["customer"] = None
+    guest["shippingAddress"] = None
+    deleted = shopify_order(1004)
+    deleted["lineItems"]["edges"][0]["node"]["variant"] = None
+    output = tmp_path / "tally.xml"
+
+    assert write_tally_envelope([guest, deleted], output) == 2
+
+    root = ET.parse(output).getroot()
+    assert [e.text for e in root.iter("PARTYNAME")][0] == "Guest Customer"
+    assert [e.text for e in root.iter("VOUCHERNUMBER")] == ["1003", "1004"]
+
+
+@pytest.mark.parametrize("processes", [None, 2])
+def test_bad_order_is_reported_and_skipped(tmp_path, capsys, processes):
+    broken = shopify_order(1006)
+    del broken["createdAt"]
+    output = tmp_path / "tally.xml"
+
+    orders = [shopify_order(1005), broken, shopify_order(1007)]
+    count = write_tally_envelope(orders, output, processes=processes)
+
+    assert count == 2
+    numbers = [element.text for element in ET.parse(output).iter("VOUCHERNUMBER")]
+    assert numbers == ["1005", "1007"]
+    if processes is None:
+        assert "Error processing order #1006" in capsys.readouterr().out
+
+
+def test_failed_write_leaves_no_partial_file(tmp_path):
+    def orders():
+        yield shopify_order(1008)
+        raise ConnectionError("connection reset")
+
+    output = tmp_path / "tally.xml"
+    with pytest.raises(ConnectionError):
+        write_tally_envelope(orders(), output)
+
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_process_orders_by_ids_writes_one_file_per_order(tmp_path, capsys):
+    store = OrderStore()
+    store.save_page([shopify_order(1009), shopify_order(1010)])
+
+    output_dir = tmp_path / "tally"
+    results = process_orders_by_ids(["1009", "404", "1010"], output_dir, store=store)
+
+    assert results["404"] is None
+    assert results["1009"]["sales_file"] == output_dir / "sales_1009.xml"
+    assert sorted(path.name for path in output_dir.iterdir()) == [
+        "sales_1009.xml",
+        "sales_1010.xml",
+    ]
+    assert "Error processing order ID 404" in capsys.readouterr().out
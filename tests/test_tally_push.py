@@ -0,0 +1,113 @@
+import xml.etree.ElementTree as ET
+
+import pytest
+
+from gst_shopify.tally_push import parse_import_response, push_to_tally
+
+
+def paid_order(number):
+    amount = {"shopMoney": {"amount": "100.00"}}
+    return {
+        "name": f"#{number}",
+        "createdAt": "2024-04-01T10:00:00Z",
+        "customer": {"firstName": "Asha", "lastName": "Rao"},
+        "shippingAddress": {"address1": "1 Main St"},
+        "subtotalPriceSet": amount,
+        "totalPriceSet": amount,
+        "lineItems": {"edges": []},
+        "transactions": [
+            {
+                "id": f"gid://shopify/OrderTransaction/{number}",
+                "kind": "SALE",
+                "status": "SUCCESS",
+                "gateway": "razorpay",
+                "processedAt": "2024-04-01T10:05:00Z",
+                "amountSet": amount,
+            }
+        ],
+    }
+
+
+def tally_response(created, errors, line_errors=()):
+    messages = "".join(f"<LINEERROR>{m}</LINEERROR>" for m in line_errors)
+    return (
+        f"<RESPONSE><CREATED>{created}</CREATED><ALTERED>0</ALTERED>"
+        f"<DELETED>0</DELETED><LASTVCHID>0</LASTVCHID><LASTMID>0</LASTMID>"
+        f"<COMBINED>0</COMBINED><IGNORED>0</IGNORED><ERRORS>{errors}</ERRORS>"
+        f"<CANCELLED>0</CANCELLED>{messages}</RESPONSE>"
+    ).encode()
+
+
+def voucher_count(request):
+    return len(ET.fromstring(request["body"]).findall(".//VOUCHER"))
+
+
+def test_parse_import_response():
+    result = parse_import_response(tally_response(3, 1, ["Ledger 'X' missing"]))
+    assert result["created"] == 3
+    assert result["errors"] == 1
+    assert result["line_errors"] == ["Ledger 'X' missing"]
+
+
+def test_push_sends_batches_and_sums_counts(stand_in, capsys):
+    def respond(request):
+        # Tally rejects the first voucher of every batch
+        count = voucher_count(request)
+        return 200, tally_response(count - 1, 1, ["Voucher date is missing"])
+
+    stand_in.respond = respond
+
+    totals = push_to_tally(
+        (paid_order(1000 + i) for i in range(5)),
+        batch_size=4,
+        company_name="Auroville Online",
+        url=stand_in.url,
+    )
+
+    assert [voucher_count(request) for request in stand_in.requests] == [4, 4, 2]
+    assert totals == {
+        "created": 7,
+        "altered": 0,
+        "ignored": 0,
+        "errors": 3,
+        "exceptions": 0,
+    }
+    body = stand_in.requests[0]["body"].decode()
+    assert "<SVCURRENTCOMPANY>Auroville Online</SVCURRENTCOMPANY>" in body
+    assert stand_in.requests[0]["headers"]["Content-Type"].startswith("text/xml")
+    assert "X-Shopify-Access-Token" not in stand_in.requests[0]["headers"]
+    assert capsys.readouterr().out.count("Tally error: Voucher date is missing") == 3
+
+
+def test_push_reports_progress_when_a_batch_fails(stand_in):
+    def respond(request):
+        if len(stand_in.requests) == 2:
+            return 500, b"Tally is busy"
+        return 200, tally_response(voucher_count(request), 0)
+
+    stand_in.respond = respond
+
+    with pytest.raises(ValueError, match="stopped after 2 vouchers .*2 created"):
+        push_to_tally(
+            (paid_order(1000 + i) for i in range(3)), batch_size=2, url=stand_in.url
+        )
+    assert len(stand_in.requests) == 2
+
+
+def test_push_skips_orders_that_cannot_be_built(stand_in, capsys):
+    stand_in.respond = lambda request: (
+        200,
+        tally_response(voucher_count(request), 0),
+    )
+    guest = paid_order(1001)
+    guest["customer"] = None
+    broken = paid_order(1002)
+    broken["transactions"][0]["id"] = None
+
+    totals = push_to_tally(
+        [paid_order(1000), broken, guest], batch_size=10, url=stand_in.url
+    )
+
+    assert totals["created"] == 4
+    assert [voucher_count(request) for request in stand_in.requests] == [4]
+    assert "Error processing order #1002" in capsys.readouterr().out
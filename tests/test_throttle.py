@@ -0,0 +1,132 @@
+from types import SimpleNamespace
+
+import pytest
+import requests
+
+from gst_shopify import api_client
+from gst_shopify.throttle import CostThrottler
+
+QUERY = '{ order(id: "gid://shopify/Order/1") { id } }'
+
+
+def cost(requested, available, maximum=1000.0, restore_rate=50.0):
+    return {
+        "requestedQueryCost": requested,
+        "actualQueryCost": requested,
+        "throttleStatus": {
+            "maximumAvailable": maximum,
+            "currentlyAvailable": available,
+            "restoreRate": restore_rate,
+        },
+    }
+
+
+class FakeResponse:
+    def __init__(self, status_code=200, data=None, headers=None):
+        self.status_code = status_code
+        self.data = data or {}
+        self.headers = headers or {}
+        self.text = str(data)
+
+    def json(self):
+        return self.data
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(f"{self.status_code} error")
+
+
+class FakeSession:
+    """Stands in for the shared session, replaying canned responses."""
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.posts = []
+
+    def post(self, url, json=None, timeout=None):
+        self.posts.append(json["query"])
+        return self.responses.pop(0)
+
+
+@pytest.fixture
+def shopify(monkeypatch):
+    """Fresh throttler, recorded sleeps, and a FakeSession set via ``.use()``."""
+    sleeps = []
+    throttler = CostThrottler(restore_rate=50.0)
+    monkeypatch.setattr(api_client, "throttler", throttler)
+    monkeypatch.setattr(api_client, "time", SimpleNamespace(sleep=sleeps.append))
+
+    def use(*responses):
+        session = FakeSession(responses)
+        monkeypatch.setattr(api_client, "get_session", lambda: session)
+        return session
+
+    return SimpleNamespace(use=use, sleeps=sleeps, throttler=throttler)
+
+
+def test_reserve_waits_for_the_missing_budget():
+    throttler = CostThrottler(maximum_available=100.0, restore_rate=50.0)
+    assert throttler.reserve(80) == 0
+    # 20 points left, 60 requested: 40 points short at 50 points a second
+    assert throttler.reserve(60) == pytest.approx(0.8, abs=0.01)
+    # Costs above the bucket size are capped so a request can always run
+    throttler = CostThrottler(maximum_available=100.0, restore_rate=50.0)
+    assert throttler.reserve(1000) == 0
+
+
+def test_settle_resyncs_while_other_requests_are_in_flight():
+    throttler = CostThrottler()
+    throttler.reserve(30)
+    throttler.reserve(20)
+
+    throttler.settle(30, QUERY, cost(30, 900.0, maximum=2000.0, restore_rate=100))
+
+    # Shopify's figure does not yet include the second request
+    assert throttler.available == pytest.approx(880.0, abs=1.0)
+    assert throttler.maximum_available == 2000.0
+    assert throttler.restore_rate == 100.0
+    # Queries of the same shape share the learned cost
+    assert throttler.estimate_cost(QUERY.replace("/1", "/2")) == 30.0
+
+
+def test_429_is_retried_after_retry_after(shopify):
+    session = shopify.use(
+        FakeResponse(429, headers={"Retry-After": "2.5"}),
+        FakeResponse(200, {"data": {"order": {"id": "1"}}}),
+    )
+
+    response = api_client.graphql_request(QUERY)
+
+    assert response == {"data": {"order": {"id": "1"}}}
+    assert len(session.posts) == 2
+    assert 2.5 in shopify.sleeps
+    assert shopify.throttler.throttled == 1
+    # The rejected request's reservation was handed back; only the
+    # successful one (at the default estimate) is still charged
+    assert shopify.throttler.available == pytest.approx(950.0, abs=1.0)
+
+
+def test_throttled_query_waits_for_refill_then_succeeds(shopify):
+    throttled = {
+        "errors": [{"message": "Throttled", "extensions": {"code": "THROTTLED"}}],
+        "extensions": {"cost": cost(100, 0.0)},
+    }
+    ok = {"data": {"order": {"id": "1"}}, "extensions": {"cost": cost(100, 900.0)}}
+    session = shopify.use(FakeResponse(200, throttled), FakeResponse(200, ok))
+
+    assert api_client.graphql_request(QUERY) == ok
+
+    assert len(session.posts) == 2
+    assert shopify.throttler.throttled == 1
+    # Retried once the synced bucket could cover the learned 100-point cost
+    assert shopify.sleeps[-1] == pytest.approx(2.0, abs=0.05)
+
+
+def test_gives_up_after_max_retries(shopify):
+    session = shopify.use(*(FakeResponse(429) for _ in range(3)))
+
+    with pytest.raises(Exception, match="Max retries reached"):
+        api_client.graphql_request(QUERY, max_retries=3)
+
+    assert len(session.posts) == 3
+    assert shopify.throttler.throttled == 3